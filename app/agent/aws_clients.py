@@ -0,0 +1,114 @@
+"""One boto3 session and a cache of tuned, thread-safe clients for the whole process.
+
+    client = clients.client("bedrock-runtime", region_name, max_pool_connections=10)
+    clients.warm_up(client)
+
+Connection settings come from the environment:
+
+* AWS_CONNECT_TIMEOUT_SECONDS (default 5)
+* AWS_READ_TIMEOUT_SECONDS (default 300, long responses from large models
+  take well over botocore's 60 second default)
+* AWS_WARM_UP=false disables warm_up
+
+boto3 and botocore are imported on first use, they take a good part of a
+second to load and the X display can come up meanwhile.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from agent.metrics import metrics
+
+class ClientFactory:
+    def __init__(self, connect_timeout=None, read_timeout=None):
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(os.environ.get("AWS_CONNECT_TIMEOUT_SECONDS", 5))
+        self.read_timeout = read_timeout if read_timeout is not None else float(os.environ.get("AWS_READ_TIMEOUT_SECONDS", 300))
+        self.warm_up_enabled = os.environ.get("AWS_WARM_UP", "true").lower() == "true"
+        # boto3 sessions are not thread-safe, clients made from them are
+        self.lock = threading.Lock()
+        self.session = None
+        self.clients = {}
+        self.warmed = set()
+        self.logger = logging.getLogger(__name__)
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                import boto3
+                self.session = boto3.Session()
+            return self.session
+
+    @staticmethod
+    def default_region():
+        return os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION") or "us-east-1"
+
+    def client(self, service_name, region_name=None, max_pool_connections=10):
+        """Shared client for `service_name`; retries are left to the caller (see agent/rate_limiter.py)."""
+        region_name = region_name or self.default_region()
+        key = (service_name, region_name, max_pool_connections)
+        session = self.get_session()
+        with self.lock:
+            if key not in self.clients:
+                from botocore.config import Config
+                config = Config(
+                    region_name=region_name,
+                    signature_version='v4',
+                    max_pool_connections=max_pool_connections,
+                    tcp_keepalive=True,
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout,
+                    retries={
+                        'max_attempts': 1,
+                        'mode': 'standard'
+                    }
+                )
+                self.clients[key] = session.client(service_name, config=config)
+                self.logger.debug(f"created {service_name} client in {region_name} with {max_pool_connections} pooled connections")
+            return self.clients[key]
+
+    def warm_up(self, *clients, connections=1, wait=False):
+        """Resolve credentials and open `connections` TLS connections per client in the background.
+
+        Only botocore clients are warmed, each once; returns the thread, or None if there was nothing to do.
+        """
+        with self.lock:
+            pending = [client for client in clients
+                       if client is not None and hasattr(client, '_endpoint') and id(client) not in self.warmed]
+            self.warmed.update(id(client) for client in pending)
+        if not self.warm_up_enabled or not pending:
+            return None
+        thread = threading.Thread(target=self._warm_up, args=(pending, connections), name="aws-warm-up", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _warm_up(self, clients, connections):
+        start = perf_counter()
+        try:
+            credentials = self.get_session().get_credentials()
+            if credentials is not None:
+                credentials.get_frozen_credentials()
+        except Exception as e:
+            self.logger.warning(f"credential resolution failed during warm-up: {e}")
+        metrics.record("aws.warm_up.credentials", perf_counter() - start)
+
+        from botocore.awsrequest import AWSRequest
+
+        def connect(client):
+            # any answer will do, the point is the pooled TLS connection it leaves behind
+            start = perf_counter()
+            try:
+                client._endpoint.http_session.send(AWSRequest(method='GET', url=client.meta.endpoint_url).prepare())
+            except Exception as e:
+                self.logger.debug(f"warm-up of {client.meta.endpoint_url} failed: {e}")
+            metrics.record("aws.warm_up.connect", perf_counter() - start, {'service': client.meta.service_model.service_name})
+
+        with ThreadPoolExecutor(max_workers=len(clients) * connections) as pool:
+            list(pool.map(connect, [client for client in clients for _ in range(connections)]))
+        self.logger.debug(f"warmed up {len(clients)} clients in {perf_counter() - start:.3f}s")
+
+# shared by every session in the process
+clients = ClientFactory()
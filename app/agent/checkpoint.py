@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from hashlib import sha256
+from time import perf_counter, strftime, time
+
+from agent.history import IMAGE_PLACEHOLDER
+from agent.metrics import metrics
+
+BLOB_REFERENCE = re.compile(r'"blob": "([0-9a-f]{64})"')
+
+class Checkpoint:
+    """Append-only log of the conversation, so a session can be resumed after a crash.
+
+    Every message added to the conversation is appended to
+    `<folder>/<session>.jsonl` as one JSON line. Image bytes are stored once
+    under `<folder>/blobs/<sha256>` and the line only holds the digest, so a
+    step costs one hash, at most one new blob file and one short append. The
+    log holds messages as they were added; history compaction is simply
+    repeated after a resume.
+
+    Once per process and folder, `prune` runs in the background: session logs
+    older than CHECKPOINT_MAX_AGE_HOURS (default 168) are removed, then the
+    oldest beyond CHECKPOINT_MAX_MB (default 1024) of logs and the blobs they
+    use, and finally the blobs no remaining log refers to.
+    """
+    # blobs touched this recently are never collected, their log line may still be on its way
+    BLOB_GRACE_SECONDS = 3600
+    _pruned_folders = set()
+    _pruned_lock = threading.Lock()
+
+    def __init__(self, folder=None, session_id=None, fsync=None):
+        self.folder = folder if folder is not None else self.default_folder()
+        self.blob_folder = os.path.join(self.folder, "blobs")
+        os.makedirs(self.blob_folder, exist_ok=True)
+        self.session_id = session_id or f"{strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.path = os.path.join(self.folder, f"{self.session_id}.jsonl")
+        self.fsync = fsync if fsync is not None else os.environ.get("CHECKPOINT_FSYNC", "false").lower() == "true"
+        self.max_age_hours = float(os.environ.get("CHECKPOINT_MAX_AGE_HOURS", 7 * 24))
+        self.max_bytes = float(os.environ.get("CHECKPOINT_MAX_MB", 1024)) * 1024 * 1024
+        self.log = None
+        self.logger = logging.getLogger(__name__)
+        with self._pruned_lock:
+            prune = self.folder not in self._pruned_folders
+            self._pruned_folders.add(self.folder)
+        if prune:
+            threading.Thread(target=self.prune, name="checkpoint-prune", daemon=True).start()
+
+    @staticmethod
+    def default_folder():
+        log_folder = os.environ.get("LOG_OUTPUT_FOLDER", os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs"))
+        return os.environ.get("CHECKPOINT_FOLDER", os.path.join(log_folder, "checkpoints"))
+
+    @classmethod
+    def latest(cls, folder=None):
+        """The checkpoint of the most recently written session in `folder`, or None."""
+        folder = folder if folder is not None else cls.default_folder()
+        logs = [name for name in os.listdir(folder) if name.endswith(".jsonl")] if os.path.isdir(folder) else []
+        if not logs:
+            return None
+        newest = max(logs, key=lambda name: os.path.getmtime(os.path.join(folder, name)))
+        return cls(folder, session_id=newest[:-len(".jsonl")])
+
+    @classmethod
+    def from_path(cls, path):
+        folder, name = os.path.split(os.path.abspath(path))
+        return cls(folder, session_id=name[:-len(".jsonl")] if name.endswith(".jsonl") else name)
+
+    def put_blob(self, data):
+        digest = sha256(data).hexdigest()
+        path = os.path.join(self.blob_folder, digest)
+        if os.path.exists(path):
+            # marks it as in use for prune
+            os.utime(path)
+        else:
+            temporary = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        return digest
+
+    def get_blob(self, digest):
+        with open(os.path.join(self.blob_folder, digest), 'rb') as f:
+            return f.read()
+
+    def _store_images(self, content):
+        stored = []
+        for block in content:
+            if 'image' in block and 'bytes' in block['image']['source']:
+                image = block['image']
+                block = {'image': {'format': image['format'], 'source': {'blob': self.put_blob(image['source']['bytes'])}}}
+            elif 'toolResult' in block:
+                block = {'toolResult': {**block['toolResult'], 'content': self._store_images(block['toolResult']['content'])}}
+            stored.append(block)
+        return stored
+
+    def append(self, message):
+        with metrics.span("checkpoint.append") as span:
+            line = json.dumps({'role': message['role'], 'content': self._store_images(message['content'])}, default=str)
+            if self.log is None:
+                self.log = self._open_log()
+            self.log.write(line + '\n')
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+            span['bytes'] = len(line)
+
+    def _open_log(self):
+        log = open(self.path, 'a+b')
+        if log.tell():
+            log.seek(-1, os.SEEK_END)
+            if log.read(1) != b'\n':
+                # finish a line cut short by a crash so it does not swallow the next one
+                log.write(b'\n')
+        log.close()
+        return open(self.path, 'a')
+
+    def load(self, keep_images=None):
+        """Rebuild the messages of this session.
+
+        Only the newest `keep_images` screenshots are read back from the blob
+        store, the others become the history placeholder straight away. A
+        toolUse whose results were never logged is dropped, so the model is
+        simply asked again.
+        """
+        start = perf_counter()
+        messages = []
+        with open(self.path) as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a line cut short by the crash
+                    self.logger.warning(f"ignoring unreadable line {number} of {self.path}")
+        # tool calls whose results were never logged; later turns may follow them once resumed
+        messages = [message for i, message in enumerate(messages)
+                    if not (message['role'] == 'assistant'
+                            and any('toolUse' in block for block in message['content'])
+                            and (i + 1 == len(messages) or messages[i + 1]['role'] != 'user'))]
+
+        images = []
+        for message in messages:
+            self._find_images(message['content'], images)
+        keep = len(images) if keep_images is None else keep_images
+        for i, (content, index) in enumerate(images):
+            digest = content[index]['image']['source']['blob']
+            if i < len(images) - keep:
+                content[index] = {'text': IMAGE_PLACEHOLDER}
+                continue
+            try:
+                content[index]['image']['source'] = {'bytes': self.get_blob(digest)}
+            except FileNotFoundError:
+                self.logger.warning(f"screenshot blob {digest} is missing")
+                content[index] = {'text': IMAGE_PLACEHOLDER}
+        self.logger.info(f"resumed {len(messages)} messages from {self.path} in {(perf_counter() - start) * 1000:.1f} ms")
+        return messages
+
+    def _find_images(self, content, images):
+        for index, block in enumerate(content):
+            if 'image' in block and 'blob' in block['image']['source']:
+                images.append((content, index))
+            elif 'toolResult' in block:
+                self._find_images(block['toolResult']['content'], images)
+
+    def prune(self):
+        """Apply the age and size limits to the session logs, then delete unreferenced blobs; this session is kept."""
+        start = perf_counter()
+        try:
+            cutoff = time() - self.max_age_hours * 3600
+            logs = []
+            expired = 0
+            for name in os.listdir(self.folder):
+                path = os.path.join(self.folder, name)
+                if not name.endswith(".jsonl") or path == self.path:
+                    continue
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    expired += 1
+                else:
+                    logs.append(path)
+            logs.sort(key=os.path.getmtime, reverse=True)
+            # newest first, each log counted with the blobs it is the first to use
+            referenced = set(self._log_blobs(self.path)) if os.path.exists(self.path) else set()
+            total = 0
+            removed = 0
+            for path in logs:
+                blobs = self._log_blobs(path)
+                total += os.path.getsize(path) + sum(self._blob_size(digest) for digest in set(blobs) - referenced)
+                if total > self.max_bytes:
+                    os.remove(path)
+                    removed += 1
+                else:
+                    referenced.update(blobs)
+            collected = 0
+            grace = time() - self.BLOB_GRACE_SECONDS
+            for digest in os.listdir(self.blob_folder):
+                path = os.path.join(self.blob_folder, digest)
+                if digest not in referenced and os.path.getmtime(path) < grace:
+                    os.remove(path)
+                    collected += 1
+            self.logger.info(f"pruned {expired} expired and {removed} session logs over {self.max_bytes / 1024 / 1024:g} MB, "
+                             f"{collected} blobs, in {(perf_counter() - start) * 1000:.0f} ms")
+        except OSError as e:
+            # another process pruning the same folder, or a session closing meanwhile
+            self.logger.warning(f"checkpoint pruning stopped: {e}")
+
+    @staticmethod
+    def _log_blobs(path):
+        with open(path, errors='replace') as f:
+            return BLOB_REFERENCE.findall(f.read())
+
+    def _blob_size(self, digest):
+        try:
+            return os.path.getsize(os.path.join(self.blob_folder, digest))
+        except FileNotFoundError:
+            return 0
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
@@ -0,0 +1,63 @@
+import logging
+import os
+import subprocess
+from time import monotonic, sleep
+
+import Xlib.display
+
+logger = logging.getLogger(__name__)
+
+def wait_for_display(name, timeout=10.0, process=None):
+    """Connect to X display `name`, retrying until the server accepts connections.
+
+    Returns the open Xlib Display. Raises TimeoutError if it is not ready in
+    time, or RuntimeError if `process` (the server) exits while waiting.
+    """
+    start = monotonic()
+    while True:
+        try:
+            display = Xlib.display.Display(name)
+            logger.debug(f"display {name} ready after {(monotonic() - start) * 1000:.0f} ms")
+            return display
+        except Exception as e:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"X server for {name} exited with code {process.returncode}") from e
+            if monotonic() - start >= timeout:
+                raise TimeoutError(f"display {name} not ready after {timeout}s: {e}") from e
+            sleep(0.05)
+
+class XvfbDisplay:
+    """An Xvfb server, plus optionally the tint2 panel, on its own display number."""
+    def __init__(self, number, width=None, height=None, log_folder=None, panel=None):
+        self.number = number
+        self.name = f":{number}"
+        self.width = width or int(os.environ.get("WIDTH", 1024))
+        self.height = height or int(os.environ.get("HEIGHT", 768))
+        self.log_folder = log_folder or os.environ.get("LOG_OUTPUT_FOLDER", os.path.dirname(__file__) + "/../logs")
+        self.panel = panel if panel is not None else os.environ.get("ORCHESTRATOR_START_PANEL", "true").lower() == "true"
+        self.processes = []
+
+    def _spawn(self, name, args, env=None):
+        with open(f"{self.log_folder}/{name}_{self.number}.log", 'wb') as log:
+            process = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, env=env)
+        self.processes.append(process)
+        return process
+
+    def start(self, timeout=10.0):
+        xvfb = self._spawn("xvfb", ["Xvfb", self.name, "-ac", "-screen", "0", f"{self.width}x{self.height}x24", "-dpi", "96"])
+        wait_for_display(self.name, timeout, xvfb).close()
+        if self.panel:
+            tint2rc = os.path.join(os.path.dirname(__file__), "..", "tint2", "tint2rc")
+            self._spawn("tint2", ["tint2", "-c", tint2rc], env={**os.environ, "DISPLAY": self.name})
+        logger.info(f"started Xvfb on {self.name} ({self.width}x{self.height})")
+        return self
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
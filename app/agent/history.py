@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+from io import BytesIO
+
+IMAGE_PLACEHOLDER = '[screenshot omitted from history]'
+SUMMARY_PREFIX = '[earlier turns omitted from history]'
+
+class ConversationHistory:
+    """Keep the Converse `messages` list within an image and token budget.
+
+    Only the newest `keep_images` image blocks are sent in full, older ones
+    become a text placeholder. If the estimated request is still over budget,
+    the oldest assistant/user turns after the initial task are dropped whole,
+    so a toolUse is never separated from its toolResult, and a one line
+    summary of each dropped tool call, assistant text and user instruction is
+    kept in the first user message.
+    """
+    # rough characters per token for text, and Anthropic's pixels per image token
+    CHARS_PER_TOKEN = 4
+    PIXELS_PER_TOKEN = 750
+
+    def __init__(self, keep_images=None, max_tokens=None, max_bytes=None, base_tokens=0):
+        self.keep_images = keep_images if keep_images is not None else int(os.environ.get("HISTORY_KEEP_IMAGES", 3))
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.environ.get("HISTORY_MAX_INPUT_TOKENS", 150000))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("HISTORY_MAX_REQUEST_BYTES", 15 * 1024 * 1024))
+        # tokens of the system prompt and tool definitions, sent on every turn
+        self.base_tokens = base_tokens
+        self.summary = []
+        self.image_tokens = {}
+        self.logger = logging.getLogger(__name__)
+
+    def estimate_image_tokens(self, image_bytes):
+        key = (len(image_bytes), image_bytes[:64], image_bytes[-64:])
+        if key not in self.image_tokens:
+            from PIL import Image
+            with Image.open(BytesIO(image_bytes)) as image:
+                width, height = image.size
+            self.image_tokens[key] = width * height // self.PIXELS_PER_TOKEN
+        return self.image_tokens[key]
+
+    def estimate(self, messages):
+        """Return (tokens, bytes) for sending `messages`."""
+        tokens, size = self.base_tokens, 0
+        for block in self._blocks(messages):
+            if 'image' in block:
+                image_bytes = block['image']['source']['bytes']
+                tokens += self.estimate_image_tokens(image_bytes)
+                size += len(image_bytes)
+            elif 'toolResult' in block:
+                # its content blocks are counted on their own
+                size += len(block['toolResult']['toolUseId'])
+            else:
+                text = json.dumps(block, default=str)
+                tokens += len(text) // self.CHARS_PER_TOKEN
+                size += len(text)
+        return tokens, size
+
+    def compact(self, messages):
+        """Compact `messages` in place before a request. Returns the number of image blocks removed."""
+        removed = self._drop_old_images(messages)
+        tokens, size = self.estimate(messages)
+        dropped = 0
+        while (tokens > self.max_tokens or size > self.max_bytes) and self._drop_oldest_turn(messages):
+            dropped += 1
+            self._write_summary(messages)
+            tokens, size = self.estimate(messages)
+        if dropped:
+            self.logger.info(f"dropped {dropped} old turns from history, estimated {tokens} tokens, {size} bytes")
+        if tokens > self.max_tokens or size > self.max_bytes:
+            self.logger.warning(f"history still over budget after compaction: {tokens} tokens, {size} bytes")
+        return removed
+
+    def has_images(self, messages):
+        return any('image' in block for block in self._blocks(messages))
+
+    def _blocks(self, messages):
+        for message in messages:
+            for block in message['content']:
+                yield block
+                if 'toolResult' in block:
+                    yield from block['toolResult']['content']
+
+    def _drop_old_images(self, messages):
+        images = []
+        for message in messages:
+            for i, block in enumerate(message['content']):
+                if 'image' in block:
+                    images.append((message['content'], i))
+                elif 'toolResult' in block:
+                    content = block['toolResult']['content']
+                    images.extend((content, j) for j, b in enumerate(content) if 'image' in b)
+        excess = max(0, len(images) - self.keep_images)
+        for content, i in images[:excess]:
+            content[i] = {'text': IMAGE_PLACEHOLDER}
+        return excess
+
+    def _drop_oldest_turn(self, messages):
+        # keep the initial task and the latest assistant/user exchange
+        if len(messages) < 5 or messages[1]['role'] != 'assistant':
+            return False
+        for block in messages[1]['content']:
+            if 'toolUse' in block:
+                self.summary.append(f"- {block['toolUse']['name']}: {json.dumps(block['toolUse']['input'], default=str)[:200]}")
+            elif block.get('text'):
+                self.summary.append(f"- assistant: {block['text'][:200]}")
+        # instructions typed in between turns, tool results are covered by their calls
+        for block in messages[2]['content']:
+            if block.get('text') and block['text'] != IMAGE_PLACEHOLDER:
+                self.summary.append(f"- user: {block['text'][:200]}")
+        del messages[1:3]
+        return True
+
+    def _write_summary(self, messages):
+        # the most recent lines are the most useful; cap the summary so it cannot grow without bound
+        text = SUMMARY_PREFIX + "\n" + "\n".join(self.summary[-50:])
+        content = messages[0]['content']
+        for block in content:
+            if block.get('text', '').startswith(SUMMARY_PREFIX):
+                block['text'] = text
+                return
+        content.append({'text': text})
@@ -0,0 +1,210 @@
+"""Local stand-ins for the bedrock-runtime and S3 clients.
+
+`ReplayBedrockClient` answers `converse`/`converse_stream` with responses
+recorded in a trajectory file (one converse response per JSONL line, as
+written by `RecordingBedrockClient`). `LocalS3Client` stores objects under a
+local directory. Both can inject latency and throttling, so the agent loop
+can be exercised and measured without AWS.
+"""
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+from time import perf_counter, sleep
+
+import botocore.session
+from botocore.exceptions import ClientError, ParamValidationError
+from botocore.serialize import create_serializer
+from botocore.validate import ParamValidator
+
+from agent.streaming import StreamAssembler
+from tool_use.s3_upload import s3_etag
+
+logger = logging.getLogger(__name__)
+
+def throttling_error(operation_name):
+    return ClientError({
+        'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests, please wait before trying again.'},
+        'ResponseMetadata': {'HTTPStatusCode': 429, 'HTTPHeaders': {}}
+    }, operation_name)
+
+class _FaultInjection:
+    def __init__(self, latency_ms=0, jitter_ms=0, throttle_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+
+    def inject(self, operation_name):
+        delay = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            sleep(delay / 1000)
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            raise throttling_error(operation_name)
+
+class RecordingBedrockClient:
+    """Wrap a real bedrock-runtime client and append every converse response to `path`.
+
+    A `converse_stream` response is recorded in the `converse` shape, as
+    rebuilt by StreamAssembler once its stream has been read to the end.
+    """
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _record(self, response):
+        recorded = {key: value for key, value in response.items() if key != 'ResponseMetadata'}
+        with self.lock, open(self.path, 'a') as f:
+            f.write(json.dumps(recorded, default=str) + '\n')
+
+    def converse(self, **kwargs):
+        response = self.client.converse(**kwargs)
+        self._record(response)
+        return response
+
+    def converse_stream(self, **kwargs):
+        response = self.client.converse_stream(**kwargs)
+        return {**response, 'stream': self._recorded_events(response['stream'])}
+
+    def _recorded_events(self, stream):
+        # the caller sees every event as it arrives; a stream given up half way is not recorded
+        assembler = StreamAssembler(log_text=False)
+        for event in stream:
+            assembler.handle(event)
+            yield event
+        self._record(assembler.assemble([]))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+class ReplayBedrockClient:
+    """Replay recorded converse responses in order.
+
+    Requests are validated and serialized exactly as botocore would, so the
+    cost of building the request body is part of what gets measured; the time
+    spent is accumulated in `serialization_seconds`. Once the recording is
+    exhausted every call answers with a plain end_turn message.
+    """
+    def __init__(self, trajectory, latency_ms=0, jitter_ms=0, throttle_rate=0.0, seed=None):
+        with open(trajectory) as f:
+            self.responses = [json.loads(line) for line in f if line.strip()]
+        self.position = 0
+        self.lock = threading.Lock()
+        self.faults = _FaultInjection(latency_ms, jitter_ms, throttle_rate, seed)
+        service_model = botocore.session.get_session().get_service_model('bedrock-runtime')
+        self.operations = {name: service_model.operation_model(name) for name in ('Converse', 'ConverseStream')}
+        self.serializer = create_serializer(service_model.metadata['protocol'])
+        self.validator = ParamValidator()
+        self.serialization_seconds = 0.0
+        self.request_bytes = 0
+
+    def _serialize(self, operation_name, params):
+        start = perf_counter()
+        operation = self.operations[operation_name]
+        report = self.validator.validate(params, operation.input_shape)
+        if report.has_errors():
+            raise ParamValidationError(report=report.generate_report())
+        request = self.serializer.serialize_to_request(params, operation)
+        self.serialization_seconds += perf_counter() - start
+        self.request_bytes += len(request['body'])
+
+    def _next_response(self):
+        with self.lock:
+            if self.position < len(self.responses):
+                response = self.responses[self.position]
+                self.position += 1
+                return response
+        return {
+            'output': {'message': {'role': 'assistant', 'content': [{'text': 'Replay finished.'}]}},
+            'stopReason': 'end_turn',
+            'usage': {'inputTokens': 0, 'outputTokens': 0, 'totalTokens': 0},
+            'metrics': {'latencyMs': 0}
+        }
+
+    def converse(self, **kwargs):
+        self._serialize('Converse', kwargs)
+        self.faults.inject('Converse')
+        return self._next_response()
+
+    def converse_stream(self, **kwargs):
+        self._serialize('ConverseStream', kwargs)
+        self.faults.inject('ConverseStream')
+        return {'stream': self._events(self._next_response())}
+
+    @staticmethod
+    def _events(response):
+        message = response['output']['message']
+        yield {'messageStart': {'role': message['role']}}
+        for index, block in enumerate(message['content']):
+            if 'toolUse' in block:
+                tool_use = block['toolUse']
+                yield {'contentBlockStart': {'contentBlockIndex': index, 'start': {'toolUse': {'toolUseId': tool_use['toolUseId'], 'name': tool_use['name']}}}}
+                yield {'contentBlockDelta': {'contentBlockIndex': index, 'delta': {'toolUse': {'input': json.dumps(tool_use['input'])}}}}
+            else:
+                yield {'contentBlockDelta': {'contentBlockIndex': index, 'delta': {'text': block.get('text', '')}}}
+            yield {'contentBlockStop': {'contentBlockIndex': index}}
+        yield {'messageStop': {'stopReason': response['stopReason']}}
+        yield {'metadata': {key: response[key] for key in ('usage', 'metrics') if key in response}}
+
+class LocalS3Client:
+    """The subset of the S3 client used by S3Upload, backed by `root`/<bucket>/<key>.
+
+    Each object's ETag is kept under `root`/.etags, computed as S3 would
+    for the transfer Config it was uploaded with, multipart uploads included.
+    """
+    def __init__(self, root, latency_ms=0, jitter_ms=0, throttle_rate=0.0, seed=None):
+        self.root = root
+        self.faults = _FaultInjection(latency_ms, jitter_ms, throttle_rate, seed)
+
+    def _path(self, bucket, key, folder=None):
+        path = os.path.join(self.root, *([folder] if folder else []), bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _store_etag(self, bucket, key, config=None):
+        path = self._path(bucket, key)
+        if config is None:
+            # put_object, and upload_fileobj with boto3's default config, which S3Upload never uses
+            etag = s3_etag(path, float('inf'), None)
+        else:
+            etag = s3_etag(path, config.multipart_threshold, config.multipart_chunksize)
+        with open(self._path(bucket, key, '.etags'), 'w') as f:
+            f.write(etag)
+        return etag
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        self.faults.inject('PutObject')
+        with open(self._path(Bucket, Key), 'wb') as f:
+            if hasattr(Body, 'read'):
+                shutil.copyfileobj(Body, f)
+            else:
+                f.write(Body)
+        return {'ETag': self._store_etag(Bucket, Key)}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        self.faults.inject('PutObject')
+        with open(self._path(Bucket, Key), 'wb') as f:
+            while chunk := Fileobj.read(1024 * 1024):
+                f.write(chunk)
+                if Callback is not None:
+                    Callback(len(chunk))
+        self._store_etag(Bucket, Key, Config)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        with open(Filename, 'rb') as f:
+            self.upload_fileobj(f, Bucket, Key, ExtraArgs, Callback, Config)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = os.path.join(self.root, Bucket, Key)
+        if not os.path.exists(path):
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, 'HeadObject')
+        try:
+            with open(self._path(Bucket, Key, '.etags')) as f:
+                etag = f.read()
+        except FileNotFoundError:
+            # written before ETags were kept
+            etag = s3_etag(path, float('inf'), None)
+        return {'ContentLength': os.path.getsize(path), 'ETag': etag}
@@ -0,0 +1,80 @@
+import atexit
+import copy
+import hashlib
+import logging
+import logging.handlers
+import os
+import queue
+import re
+from pprint import pformat
+
+# reprs of long byte strings that were formatted into a message before it got here
+BYTES_REPR = re.compile(r"""b(['"])(?:\\.|(?!\1).){256,}?\1""")
+
+def redact(value):
+    """Copy of `value` with every bytes object replaced by a short size and hash placeholder."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        return f"<{len(data)} bytes sha1:{hashlib.sha1(data).hexdigest()[:12]}>"
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    return value
+
+class LazyPformat:
+    """Pretty-print `value`, minus binary payloads, only if the record is actually emitted.
+
+        logger.debug("response:\\n%s", LazyPformat(response))
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return pformat(redact(self.value))
+
+class BinarySafeFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        return BYTES_REPR.sub(lambda match: f"<{len(match.group(0))} char bytes repr>", message)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without formatting them, so the listener thread pays for it.
+
+    Arguments are formatted later on the listener thread, so callers should
+    not mutate objects they have passed as logging arguments.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            # tracebacks cannot be formatted once the frames are gone
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def configure_logging(log_folder, filename, file_level=logging.DEBUG, console_level=logging.INFO):
+    """Route all logging through a queue to a size-rotated file and the console.
+
+    Rotation is configured with LOG_MAX_BYTES and LOG_BACKUP_COUNT.
+    """
+    formatter = BinarySafeFormatter(
+        fmt="%(asctime)s [%(filename)s:%(lineno)s - %(funcName)10s() ] %(message)s",
+        datefmt="%Y-%m-%d:%H:%M:%S"
+    )
+    file_handler = logging.handlers.RotatingFileHandler(
+        f"{log_folder}/{filename}.log",
+        maxBytes=int(os.environ.get("LOG_MAX_BYTES", 50 * 1024 * 1024)),
+        backupCount=int(os.environ.get("LOG_BACKUP_COUNT", 5))
+    )
+    file_handler.setLevel(file_level)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logging.basicConfig(force=True, handlers=[DeferredQueueHandler(log_queue)])
+    return listener
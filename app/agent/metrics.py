@@ -0,0 +1,145 @@
+"""Timing spans and counters for the agent loop.
+
+    with metrics.span("screenshot.encode", format="png") as span:
+        image_bytes = encode(image)
+        span["bytes"] = len(image_bytes)
+
+Keyword arguments of `span` are low-cardinality labels used for both exports;
+values set on the yielded dict only go to the trace. Spans always feed the
+in-memory histograms; exports are enabled through the environment:
+
+* METRICS_TRACE_FILE: one JSON line per span
+* METRICS_PROMETHEUS_FILE: Prometheus text format, rewritten on every flush
+  (suits node_exporter's textfile collector)
+* METRICS_PORT: serve the same text on http://0.0.0.0:<port>/metrics
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+class Metrics:
+    def __init__(self, trace_path=None, prometheus_path=None, port=None):
+        self.trace_path = trace_path if trace_path is not None else os.environ.get("METRICS_TRACE_FILE")
+        self.prometheus_path = prometheus_path if prometheus_path is not None else os.environ.get("METRICS_PROMETHEUS_FILE")
+        port = port if port is not None else os.environ.get("METRICS_PORT")
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.trace = open(self.trace_path, 'a') if self.trace_path else None
+        self.server = None
+        self.logger = logging.getLogger(__name__)
+        if port:
+            self._serve(int(port))
+        atexit.register(self.flush)
+
+    @contextmanager
+    def span(self, name, **labels):
+        attributes = {}
+        start = perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes['error'] = e.__class__.__name__
+            raise
+        finally:
+            self.record(name, perf_counter() - start, labels, attributes)
+
+    def record(self, name, seconds, labels=None, attributes=None):
+        """Record a span of `seconds` that was timed elsewhere."""
+        labels = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            histogram = self.histograms.setdefault(('agent_span_seconds', (('span', name),) + labels), [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+            if attributes and 'bytes' in attributes:
+                key = ('agent_payload_bytes_total', (('span', name),) + labels)
+                self.counters[key] = self.counters.get(key, 0) + attributes['bytes']
+            if self.trace is not None:
+                self.trace.write(json.dumps({
+                    'ts': round(time() - seconds, 6),
+                    'span': name,
+                    'duration_ms': round(seconds * 1000, 3),
+                    **dict(labels),
+                    **(attributes or {})
+                }, default=str) + '\n')
+
+    def count(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_bedrock_response(self, response):
+        """Token counters from `usage` and the server side latency from `metrics` of a converse response."""
+        for key, token_type in (('inputTokens', 'input'), ('outputTokens', 'output'),
+                                ('cacheReadInputTokens', 'cache_read'), ('cacheWriteInputTokens', 'cache_write')):
+            if key in response.get('usage', {}):
+                self.count('bedrock_tokens_total', response['usage'][key], type=token_type)
+        if 'latencyMs' in response.get('metrics', {}):
+            self.record('bedrock.server_latency', response['metrics']['latencyMs'] / 1000)
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        if histograms:
+            lines.append('# TYPE agent_span_seconds histogram')
+        for (name, labels), (buckets, total, count) in histograms:
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                lines.append(f'{name}_bucket{_label_text(labels + (("le", bound),))} {bucket_count}')
+            lines.append(f'{name}_bucket{_label_text(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_label_text(labels)} {total}')
+            lines.append(f'{name}_count{_label_text(labels)} {count}')
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{_label_text(labels)} {value}' for (n, labels), value in counters if n == name)
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """Flush the trace and rewrite the Prometheus file, if configured."""
+        with self.lock:
+            if self.trace is not None:
+                self.trace.flush()
+        if self.prometheus_path:
+            temporary = f"{self.prometheus_path}.tmp"
+            with open(temporary, 'w') as f:
+                f.write(self.prometheus_text())
+            os.replace(temporary, self.prometheus_path)
+
+    def _serve(self, port):
+        metrics = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        self.logger.info(f"serving metrics on port {port}")
+
+# shared by every module and session in the process
+metrics = Metrics()
@@ -0,0 +1,67 @@
+import logging
+import os
+
+CACHE_POINT = {'cachePoint': {'type': 'default'}}
+
+def supports_cache_points():
+    """Whether the installed botocore models `cachePoint` blocks for bedrock-runtime (1.37.25 and later)."""
+    from botocore.loaders import create_loader
+    model = create_loader().load_service_model('bedrock-runtime', 'service-2')
+    return 'CachePointBlock' in model['shapes']
+
+class PromptCache:
+    """Insert Converse cache checkpoints and track how well they are hit.
+
+    Fixed checkpoints go after the tool definitions and after the system
+    prompt; the latter also covers the computer tool sent through
+    `additionalModelRequestFields`, which the model renders before the system
+    prompt. An optional moving checkpoint on the latest message lets the next
+    turn reuse the whole conversation prefix. That prefix is only stable
+    while history compaction leaves it alone, so a larger HISTORY_KEEP_IMAGES
+    gives more cache hits.
+    """
+    def __init__(self, enabled=None, cache_messages=None):
+        self.enabled = enabled if enabled is not None else os.environ.get("BEDROCK_PROMPT_CACHING", "false").lower() == "true"
+        if self.enabled and not supports_cache_points():
+            # botocore would reject every converse call with an unknown parameter
+            import botocore
+            raise ValueError(f"BEDROCK_PROMPT_CACHING=true needs botocore 1.37.25 or later for cachePoint blocks, found {botocore.__version__}")
+        self.cache_messages = cache_messages if cache_messages is not None else os.environ.get("BEDROCK_PROMPT_CACHE_MESSAGES", "true").lower() == "true"
+        self.requests = 0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.logger = logging.getLogger(__name__)
+
+    def system(self, system):
+        if not self.enabled:
+            return system
+        return [*system, CACHE_POINT]
+
+    def tool_config(self, tool_config):
+        if not self.enabled or not tool_config.get('tools'):
+            return tool_config
+        return {**tool_config, 'tools': [*tool_config['tools'], CACHE_POINT]}
+
+    def messages(self, messages):
+        """Return `messages` with a checkpoint after the latest message, leaving the stored history untouched."""
+        if not self.enabled or not self.cache_messages or not messages:
+            return messages
+        last = messages[-1]
+        return [*messages[:-1], {**last, 'content': [*last['content'], CACHE_POINT]}]
+
+    def record(self, usage):
+        if not usage:
+            return
+        self.requests += 1
+        self.input_tokens += usage.get('inputTokens', 0)
+        self.cache_read_tokens += usage.get('cacheReadInputTokens', 0)
+        self.cache_write_tokens += usage.get('cacheWriteInputTokens', 0)
+        if self.enabled:
+            self.logger.debug(f"cache read {usage.get('cacheReadInputTokens', 0)}, write {usage.get('cacheWriteInputTokens', 0)}, "
+                              f"input {usage.get('inputTokens', 0)} tokens, session hit rate {self.hit_rate:.1%}")
+
+    @property
+    def hit_rate(self):
+        total = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+        return self.cache_read_tokens / total if total else 0.0
@@ -0,0 +1,144 @@
+import logging
+import os
+import random
+import threading
+from time import monotonic, sleep
+
+from botocore.exceptions import ClientError, ConnectionClosedError, EndpointConnectionError, ReadTimeoutError
+
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+    # raised by botocore as EventStreamError while a converse_stream response is read
+    'throttlingException',
+    'serviceUnavailableException',
+    'internalServerException',
+    'modelStreamErrorException',
+}
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException', 'throttlingException'}
+
+class TokenBucket:
+    """Refills `rate` units per second up to `capacity`.
+
+    The balance may go negative when the real cost of a call turns out higher
+    than estimated; later acquirers then wait until the debt is paid off.
+    """
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.balance = capacity
+        self.updated = monotonic()
+
+    def _refill(self, now):
+        self.balance = min(self.capacity, self.balance + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken; at most a full bucket is ever required."""
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.balance
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount):
+        self.balance -= amount
+
+class RateLimiter:
+    """Client-side pacing and retries for Bedrock calls.
+
+    Requests and tokens are paced by buckets sized from BEDROCK_MAX_RPM and
+    BEDROCK_MAX_TPM (0 disables either), so calls only wait when the quota is
+    actually close. Throttling and transient errors are retried with jittered
+    exponential backoff, honouring a Retry-After hint, and a throttle pauses
+    every caller sharing this limiter.
+    """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_attempts=None, base_delay=None, max_delay=None):
+        requests_per_minute = requests_per_minute if requests_per_minute is not None else int(os.environ.get("BEDROCK_MAX_RPM", 0))
+        tokens_per_minute = tokens_per_minute if tokens_per_minute is not None else int(os.environ.get("BEDROCK_MAX_TPM", 0))
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.environ.get("BEDROCK_MAX_ATTEMPTS", 8))
+        self.base_delay = base_delay if base_delay is not None else float(os.environ.get("BEDROCK_RETRY_BASE_SECONDS", 1))
+        self.max_delay = max_delay if max_delay is not None else float(os.environ.get("BEDROCK_RETRY_MAX_SECONDS", 60))
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def acquire(self, tokens=0):
+        """Block until one request costing `tokens` input tokens fits within the quotas."""
+        while True:
+            with self.lock:
+                now = monotonic()
+                wait = self.paused_until - now
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    if self.requests is not None:
+                        self.requests.take(1)
+                    if self.tokens is not None:
+                        self.tokens.take(tokens)
+                    return
+            self.logger.debug(f"rate limiter waiting {wait:.2f}s")
+            sleep(wait)
+
+    def record_usage(self, estimated_tokens, usage):
+        """Correct the token bucket once the real usage of a call is known."""
+        if self.tokens is None or not usage:
+            return
+        actual = usage.get('inputTokens', 0) + usage.get('outputTokens', 0)
+        with self.lock:
+            self.tokens.take(actual - estimated_tokens)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def retry_after(error):
+        headers = error.response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        try:
+            return float(headers['retry-after'])
+        except (KeyError, ValueError):
+            return None
+
+    def call(self, fn, estimated_tokens=0, can_retry=None):
+        """Call `fn` within the quotas, retrying throttles and transient failures.
+
+        `can_retry`, when given, is asked before each retry; a False answer re-raises the error.
+        """
+        for attempt in range(self.max_attempts):
+            self.acquire(estimated_tokens)
+            try:
+                response = fn()
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+                if (code not in RETRYABLE_ERROR_CODES and status < 500) or attempt == self.max_attempts - 1 \
+                        or (can_retry is not None and not can_retry()):
+                    raise
+                delay = self.backoff(attempt, self.retry_after(e))
+                if code in THROTTLING_ERROR_CODES:
+                    # everyone sharing the quota backs off, not just this caller
+                    self.pause(delay)
+                self.logger.warning(f"{code} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+                if code not in THROTTLING_ERROR_CODES:
+                    sleep(delay)
+            except (ConnectionClosedError, EndpointConnectionError, ReadTimeoutError) as e:
+                if attempt == self.max_attempts - 1 or (can_retry is not None and not can_retry()):
+                    raise
+                delay = self.backoff(attempt)
+                self.logger.warning(f"{e.__class__.__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+                sleep(delay)
+            else:
+                self.record_usage(estimated_tokens, response.get('usage'))
+                return response
@@ -0,0 +1,80 @@
+"""Cold start support: deferred imports and startup timings.
+
+    pyautogui = LazyModule("pyautogui")  # imported on first attribute access
+    preload(pyautogui)                   # or ahead of time on a background thread
+    startup.mark("imports")              # time since the previous mark
+
+Every mark and deferred import is recorded as a "startup" span, and
+`startup.report()` logs them as one line.
+"""
+import importlib
+import logging
+import threading
+from time import perf_counter
+
+from agent.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    def __init__(self):
+        self.start = self.last = perf_counter()
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def mark(self, phase):
+        """Record the time since the previous mark, or since this module was imported, as `phase`."""
+        with self.lock:
+            now = perf_counter()
+            seconds, self.last = now - self.last, now
+            self.phases.append((phase, seconds))
+        metrics.record("startup", seconds, {'phase': phase})
+
+    def record(self, phase, seconds):
+        """Record a phase that ran alongside the marked ones, such as a background import."""
+        with self.lock:
+            self.phases.append((phase, seconds))
+        metrics.record("startup", seconds, {'phase': phase})
+
+    def report(self):
+        with self.lock:
+            phases = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases)
+            total = perf_counter() - self.start
+        logger.info(f"startup: {phases}; ready after {total * 1000:.0f} ms")
+
+# started when the first module of the app imports this one
+startup = StartupTimer()
+
+class LazyModule:
+    """Stand-in for a module that is imported the first time one of its attributes is used."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = perf_counter()
+                    module = importlib.import_module(self._name)
+                    startup.record(f"import {self._name}", perf_counter() - start)
+                    logger.debug(f"imported {self._name} in {(perf_counter() - start) * 1000:.0f} ms")
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+def preload(*modules):
+    """Import LazyModules on a background thread, so their first use does not pay for it."""
+    def load():
+        for module in modules:
+            try:
+                module._load()
+            except Exception as e:
+                # the first real use raises it again where it can be handled
+                logger.debug(f"preloading {module._name} failed: {e}")
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    thread.start()
+    return thread
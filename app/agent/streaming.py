@@ -0,0 +1,81 @@
+import json
+import logging
+
+class StreamAssembler:
+    """Rebuild a `converse` style response from `converse_stream` events.
+
+    Text is logged line by line as it arrives, and `on_tool_use` is called
+    with each complete toolUse block as soon as its contentBlockStop event is
+    seen, before the rest of the message has been generated. The assembled
+    response has the same `output`, `stopReason`, `usage` and `metrics` shape
+    as the non-streaming API, so the message stored in history is identical.
+    """
+    def __init__(self, on_tool_use=None, log_text=True):
+        self.on_tool_use = on_tool_use
+        self.log_text = log_text
+        self.logger = logging.getLogger(__name__)
+        self.role = 'assistant'
+        self.blocks = {}
+        self.pending_text = {}
+        self.response = {'output': {'message': {}}, 'stopReason': None}
+
+    def assemble(self, events):
+        for event in events:
+            self.handle(event)
+        self.response['output']['message'] = {
+            'role': self.role,
+            'content': [self.blocks[index] for index in sorted(self.blocks)]
+        }
+        return self.response
+
+    def handle(self, event):
+        if 'messageStart' in event:
+            self.role = event['messageStart']['role']
+        elif 'contentBlockStart' in event:
+            start = event['contentBlockStart']
+            if 'toolUse' in start.get('start', {}):
+                tool_use = start['start']['toolUse']
+                self.blocks[start['contentBlockIndex']] = {
+                    'toolUse': {'toolUseId': tool_use['toolUseId'], 'name': tool_use['name'], 'input': ''}
+                }
+        elif 'contentBlockDelta' in event:
+            self._delta(event['contentBlockDelta']['contentBlockIndex'], event['contentBlockDelta']['delta'])
+        elif 'contentBlockStop' in event:
+            self._stop(event['contentBlockStop']['contentBlockIndex'])
+        elif 'messageStop' in event:
+            self.response['stopReason'] = event['messageStop']['stopReason']
+            if 'additionalModelResponseFields' in event['messageStop']:
+                self.response['additionalModelResponseFields'] = event['messageStop']['additionalModelResponseFields']
+        elif 'metadata' in event:
+            for key in ('usage', 'metrics'):
+                if key in event['metadata']:
+                    self.response[key] = event['metadata'][key]
+        else:
+            # stream errors are raised by botocore as EventStreamError, anything else is an event added later
+            self.logger.debug(f"ignoring converse_stream event {', '.join(event)}")
+
+    def _delta(self, index, delta):
+        if 'text' in delta:
+            block = self.blocks.setdefault(index, {'text': ''})
+            block['text'] += delta['text']
+            pending = self.pending_text.get(index, '') + delta['text']
+            *lines, pending = pending.split('\n')
+            if self.log_text:
+                for line in lines:
+                    self.logger.info(f'agent: {line}')
+            self.pending_text[index] = pending
+        elif 'toolUse' in delta:
+            self.blocks[index]['toolUse']['input'] += delta['toolUse']['input']
+
+    def _stop(self, index):
+        block = self.blocks.get(index)
+        if block is None:
+            return
+        if 'text' in block:
+            if self.log_text and self.pending_text.get(index):
+                self.logger.info(f"agent: {self.pending_text.pop(index)}")
+        elif 'toolUse' in block:
+            tool_use = block['toolUse']
+            tool_use['input'] = json.loads(tool_use['input']) if tool_use['input'] else {}
+            if self.on_tool_use is not None:
+                self.on_tool_use(tool_use)
@@ -0,0 +1,56 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# tools that act on the screen; they run one at a time, in the order the model asked for them
+GUI_TOOLS = {'computer'}
+
+class ToolScheduler:
+    """Run the tool calls of a turn as soon as they are known.
+
+    GUI tools go through a single worker thread, so actions and the shell
+    commands between them keep their order. Every other tool, such as the S3
+    uploads, runs on a pool of TOOL_WORKERS threads, concurrently with each
+    other and with GUI calls requested after it. It does wait for the GUI
+    calls requested before it, which may be producing the file it uploads. `submit` returns a Future; `results` gathers
+    the toolResult blocks in the order of the toolUse blocks.
+    """
+    def __init__(self, execute, workers=None, gui_tools=GUI_TOOLS):
+        self.execute = execute
+        self.gui_tools = gui_tools
+        self.gui = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tool-gui")
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers or int(os.environ.get("TOOL_WORKERS", 4)),
+            thread_name_prefix="tool"
+        )
+        # the GUI queue runs in order, so the last call submitted to it is the one to wait for
+        self.last_gui = None
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, toolUse):
+        if toolUse['name'] in self.gui_tools:
+            self.logger.debug(f"scheduling {toolUse['name']} {toolUse['toolUseId']} on gui queue")
+            self.last_gui = self.gui.submit(self.execute, toolUse)
+            return self.last_gui
+        self.logger.debug(f"scheduling {toolUse['name']} {toolUse['toolUseId']} on pool")
+        return self.pool.submit(self._after, self.last_gui, toolUse)
+
+    def _after(self, gui_call, toolUse):
+        if gui_call is not None and not gui_call.done():
+            self.logger.debug(f"{toolUse['name']} {toolUse['toolUseId']} waits for the GUI calls before it")
+            wait([gui_call])
+        return self.execute(toolUse)
+
+    def results(self, toolUses, dispatched=None):
+        """toolResult blocks for `toolUses` in order, submitting those not already in `dispatched` (toolUseId -> Future)."""
+        dispatched = dispatched if dispatched is not None else {}
+        futures = []
+        for toolUse in toolUses:
+            if toolUse['toolUseId'] not in dispatched:
+                dispatched[toolUse['toolUseId']] = self.submit(toolUse)
+            futures.append(dispatched[toolUse['toolUseId']])
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.gui.shutdown()
+        self.pool.shutdown()
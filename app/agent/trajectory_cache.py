@@ -0,0 +1,118 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import uuid
+from time import time
+
+from tool_use.frame_hash import BlockHash
+
+def hash_to_json(frame_hash):
+    if frame_hash is None:
+        return None
+    return {'blocks': frame_hash.blocks.hex(), 'columns': frame_hash.columns, 'rows': frame_hash.rows}
+
+def hash_from_json(value):
+    if value is None:
+        return None
+    return BlockHash(bytes.fromhex(value['blocks']), value['columns'], value['rows'])
+
+class TrajectoryCache:
+    """Tool calls of successful runs, keyed on the task text and the screen they started from.
+
+    Each entry is one JSON file `<task digest>-<start screen digest>.json`
+    holding the steps (tool name, input and the BlockHash of the screen after
+    the step) and the model's final message. A lookup matches the task text
+    exactly, up to whitespace, and the starting screen within `threshold`,
+    the fraction of changed blocks. A file's mtime is its last use: entries
+    older than `max_age_hours` are dropped, then the least recently used
+    beyond `max_entries`.
+    """
+    def __init__(self, folder=None, max_entries=None, max_age_hours=None, threshold=None):
+        log_folder = os.environ.get("LOG_OUTPUT_FOLDER", os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs"))
+        self.folder = folder if folder is not None else os.environ.get("TRAJECTORY_CACHE_FOLDER", os.path.join(log_folder, "trajectory_cache"))
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get("TRAJECTORY_CACHE_MAX_ENTRIES", 200))
+        self.max_age_hours = max_age_hours if max_age_hours is not None else float(os.environ.get("TRAJECTORY_CACHE_MAX_AGE_HOURS", 7 * 24))
+        self.threshold = threshold if threshold is not None else float(os.environ.get("TRAJECTORY_CACHE_THRESHOLD", 0.01))
+        os.makedirs(self.folder, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def normalize(task):
+        return ' '.join(task.split())
+
+    @classmethod
+    def task_key(cls, task):
+        return hashlib.sha256(cls.normalize(task).encode('utf-8')).hexdigest()[:16]
+
+    def _expired(self, entry):
+        return time() - entry['created'] > self.max_age_hours * 3600
+
+    def _entries(self, task):
+        for path in glob.glob(os.path.join(self.folder, f"{self.task_key(task)}-*.json")):
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"ignoring unreadable trajectory {path}: {e}")
+                continue
+            yield path, entry
+
+    def _find(self, task, start_hash):
+        for path, entry in self._entries(task):
+            if self._expired(entry):
+                os.remove(path)
+                continue
+            if self.normalize(entry['task']) == self.normalize(task) and start_hash.difference(hash_from_json(entry['start'])) <= self.threshold:
+                return path, entry
+        return None, None
+
+    def lookup(self, task, start_hash):
+        """The recorded run of `task` from a screen like `start_hash`, or None."""
+        path, entry = self._find(task, start_hash)
+        if entry is None:
+            self.logger.debug(f"trajectory cache miss for task {self.task_key(task)}")
+            return None
+        os.utime(path)
+        for step in entry['steps']:
+            step['hash'] = hash_from_json(step['hash'])
+        self.logger.info(f"trajectory cache hit {os.path.basename(path)}, {len(entry['steps'])} steps")
+        return entry
+
+    def store(self, task, start_hash, steps, final_message):
+        """Record a successful run; replaces the entry for the same task and starting screen."""
+        path, _ = self._find(task, start_hash)
+        if path is None:
+            path = os.path.join(self.folder, f"{self.task_key(task)}-{start_hash.hexdigest()[:16]}.json")
+        entry = {
+            'task': task,
+            'start': hash_to_json(start_hash),
+            'created': time(),
+            'steps': [{**step, 'hash': hash_to_json(step['hash'])} for step in steps],
+            'final_message': final_message
+        }
+        temporary = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(entry, f, default=str)
+        os.replace(temporary, path)
+        self.logger.info(f"stored trajectory {os.path.basename(path)}, {len(steps)} steps")
+        self.evict()
+
+    def evict(self):
+        paths = glob.glob(os.path.join(self.folder, "*.json"))
+        cutoff = time() - self.max_age_hours * 3600
+        live = []
+        for path in paths:
+            try:
+                # created is never later than the last use, so an old mtime is enough to expire without parsing
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                else:
+                    live.append(path)
+            except FileNotFoundError:
+                pass
+        live.sort(key=os.path.getmtime, reverse=True)
+        for path in live[self.max_entries:]:
+            os.remove(path)
+            self.logger.debug(f"evicted trajectory {os.path.basename(path)}")
@@ -0,0 +1,101 @@
+"""Run computer use tasks unattended from a JSONL task queue.
+
+    python3 app/batch.py tasks.jsonl --concurrency 4 --output results.jsonl
+    python3 app/batch.py tasks/ --max-steps 60 --max-seconds 1800
+
+Each line of a task file is a JSON object:
+
+    {"task_id": "coe-price", "prompt": "Retrieve ...", "max_steps": 40, "max_seconds": 900}
+
+`prompt` must be a non-empty string, a task without one stops the batch
+before anything runs. `task_id`, `max_steps` and `max_seconds` are optional; the budgets default to
+the command line values. A directory is read as every *.jsonl file in it, in
+name order. One result record per task is appended to the output file as soon
+as the task finishes; tasks whose task_id already has a record there are
+skipped, so an interrupted batch can simply be started again.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from orchestrator import Orchestrator
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+def read_tasks(path):
+    path = Path(path)
+    files = sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+    for task_file in files:
+        with open(task_file) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                task = json.loads(line)
+                if not isinstance(task.get('prompt'), str) or not task['prompt'].strip():
+                    # an empty prompt would leave a worker waiting for input nobody gives
+                    raise ValueError(f"{task_file}:{line_number}: task has no prompt")
+                task.setdefault('task_id', f"{task_file.stem}:{line_number}")
+                yield task
+
+def completed_task_ids(output):
+    if not os.path.exists(output):
+        return set()
+    with open(output) as f:
+        return {json.loads(line)['task_id'] for line in f if line.strip()}
+
+class BatchRunner:
+    def __init__(self, orchestrator, output, max_steps=None, max_seconds=None):
+        self.orchestrator = orchestrator
+        self.output = output
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.output_lock = threading.Lock()
+
+    def write_result(self, record):
+        with self.output_lock, open(self.output, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+    def run_task(self, task):
+        record = {'task_id': task['task_id'], 'started_at': datetime.now(timezone.utc).isoformat()}
+        try:
+            record.update(self.orchestrator.run_task(
+                task['prompt'],
+                max_steps=task.get('max_steps', self.max_steps),
+                max_seconds=task.get('max_seconds', self.max_seconds)
+            ))
+        except Exception as e:
+            logger.exception(f"task {task['task_id']} failed")
+            record.update({'outcome': 'error', 'error': f"{e.__class__.__name__}: {e}"})
+        logger.info(f"task {task['task_id']}: {record['outcome']} after {record.get('steps')} steps")
+        self.write_result(record)
+        return record
+
+    def run(self, tasks):
+        with ThreadPoolExecutor(self.orchestrator.sessions) as pool:
+            return list(pool.map(self.run_task, tasks))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="JSONL task file, or a directory of them")
+    parser.add_argument("--output", default=os.path.join(os.environ.get("LOG_OUTPUT_FOLDER", os.path.dirname(__file__) + "/logs"), "batch_results.jsonl"))
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("BATCH_CONCURRENCY", 1)))
+    parser.add_argument("--max-steps", type=int, default=int(os.environ.get("BATCH_MAX_STEPS", 50)))
+    parser.add_argument("--max-seconds", type=float, default=float(os.environ.get("BATCH_MAX_SECONDS", 1800)))
+    args = parser.parse_args()
+
+    done = completed_task_ids(args.output)
+    tasks = [task for task in read_tasks(args.tasks) if task['task_id'] not in done]
+    logger.warning(f"{len(tasks)} tasks to run, {len(done)} already have results in {args.output}")
+    if tasks:
+        orchestrator = Orchestrator(min(args.concurrency, len(tasks)))
+        try:
+            orchestrator.start()
+            BatchRunner(orchestrator, args.output, args.max_steps, args.max_seconds).run(tasks)
+        finally:
+            orchestrator.stop()
@@ -0,0 +1,58 @@
+"""Screen capture latency: pyautogui.screenshot() versus X11Capture.
+
+Run inside the container (or anywhere with an Xvfb display):
+
+    DISPLAY=:0 python3 app/benchmarks/capture_bench.py --iterations 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import Xlib.display
+
+def measure(name, fn, iterations):
+    fn()  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<28} mean {statistics.mean(samples):8.2f} ms  p50 {statistics.median(samples):8.2f} ms  p99 {p99:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY"):
+        sys.exit("DISPLAY is not set")
+
+    import pyautogui
+    from tool_use.x11_capture import X11Capture
+
+    display = Xlib.display.Display(os.environ["DISPLAY"])
+    pyautogui._pyautogui_x11._display = display
+
+    measure("pyautogui.screenshot()", pyautogui.screenshot, args.iterations)
+
+    getimage = X11Capture(display, use_shm=False)
+    measure("X11Capture getimage", getimage.capture, args.iterations)
+    measure("X11Capture getimage + PIL", lambda: getimage.capture().to_image(), args.iterations)
+    getimage.close()
+
+    shm = X11Capture(display, use_shm=True)
+    if shm.backend == "xshm":
+        measure("X11Capture xshm", shm.capture, args.iterations)
+        measure("X11Capture xshm + PIL", lambda: shm.capture().to_image(), args.iterations)
+    else:
+        print("MIT-SHM not available on this display, skipped")
+    shm.close()
+
+if __name__ == "__main__":
+    main()
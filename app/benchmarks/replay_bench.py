@@ -0,0 +1,151 @@
+"""Measure the agent loop's own overhead by replaying a recorded trajectory.
+
+Bedrock and S3 are replaced by the local stand-ins in agent/local_aws.py, so
+the only costs left are the ones this repo controls: screen capture, image
+encoding, request serialization, tool execution and logging. Actions in the
+trajectory really run against the X display.
+
+Record a trajectory from a live session with
+
+    BEDROCK_RECORD_TRAJECTORY=/home/computeruse/logs/trajectory.jsonl python3 app/main.py "..."
+
+then replay it, optionally on a fresh Xvfb display:
+
+    python3 app/benchmarks/replay_bench.py logs/trajectory.jsonl --start-xvfb --repeat 5
+    python3 app/benchmarks/replay_bench.py logs/trajectory.jsonl --latency-ms 800 --throttle-rate 0.1
+
+Timings are per step (one Bedrock call plus the tools it asked for) and are
+inclusive: "tool" contains the capture, encode and settle time of the
+actions it ran.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+STAGES = ["step", "bedrock", "serialization", "tool", "settle", "capture", "encode", "logging"]
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+class StepTimer:
+    """Accumulate time spent in wrapped callables, bucketed per agent step."""
+    def __init__(self):
+        self.steps = []
+        self.current = None
+        self.step_start = None
+
+    def next_step(self):
+        now = perf_counter()
+        if self.current is not None:
+            self.current["step"] = now - self.step_start
+            self.steps.append(self.current)
+        self.current = defaultdict(float)
+        self.step_start = now
+
+    def add(self, stage, seconds):
+        if self.current is not None:
+            self.current[stage] += seconds
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage, perf_counter() - start)
+        setattr(owner, name, timed)
+
+    def report(self):
+        print(f"{len(self.steps)} steps")
+        print(f"{'stage':<14}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        for stage in STAGES:
+            samples = [step.get(stage, 0.0) * 1000 for step in self.steps]
+            if not samples or not any(samples):
+                continue
+            print(f"{stage:<14}{percentile(samples, 0.5):>10.2f}{percentile(samples, 0.99):>10.2f}{sum(samples) / len(samples):>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trajectory", help="JSONL file of recorded converse responses")
+    parser.add_argument("--prompt", default="Replay of a recorded trajectory")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated Bedrock and S3 latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of calls answered with ThrottlingException")
+    parser.add_argument("--start-xvfb", action="store_true", help="run on a fresh Xvfb display instead of $DISPLAY")
+    args = parser.parse_args()
+
+    # the stand-ins replace every AWS client, there is nothing to warm up
+    os.environ.setdefault("AWS_WARM_UP", "false")
+    display = None
+    if args.start_xvfb:
+        from agent.displays import XvfbDisplay
+        display = XvfbDisplay(int(os.environ.get("ORCHESTRATOR_BASE_DISPLAY", 10)), panel=False).start()
+        os.environ["DISPLAY"] = display.name
+    try:
+        import pyautogui
+        import main as agent_main
+        from agent.local_aws import LocalS3Client, ReplayBedrockClient
+        from tool_use.computer_use import ComputerUse, ScreenshotSettings
+        from tool_use.screen_settle import ScreenSettle
+        from tool_use.x11_capture import Frame, X11Capture
+
+        timer = StepTimer()
+        timer.wrap(X11Capture, "capture", "capture")
+        timer.wrap(Frame, "to_image", "capture")
+        timer.wrap(pyautogui, "screenshot", "capture")
+        timer.wrap(ScreenshotSettings, "scale", "encode")
+        timer.wrap(ScreenshotSettings, "encode", "encode")
+        timer.wrap(ScreenSettle, "wait", "settle")
+        timer.wrap(agent_main.BedrockComputerInteraction, "execute_tool", "tool")
+        for handler in logging.getLogger().handlers:
+            timer.wrap(handler, "handle", "logging")
+
+        system, tool_config, additional_request_fields = agent_main.build_request_config()
+        s3_root = tempfile.mkdtemp(prefix="local_s3_")
+        for _ in range(args.repeat):
+            client = ReplayBedrockClient(args.trajectory, args.latency_ms, args.jitter_ms, args.throttle_rate)
+            computer_use = ComputerUse(os.environ.get("DISPLAY"))
+            interaction = agent_main.BedrockComputerInteraction(
+                region_name=agent_main.REGION_NAME,
+                model_id=agent_main.MODEL_ID,
+                system=system,
+                tool_config=tool_config,
+                additional_request_fields=additional_request_fields,
+                client=client,
+                computer_use=computer_use
+            )
+            interaction.tool_use_s3_upload.client = LocalS3Client(s3_root, args.latency_ms, args.jitter_ms, args.throttle_rate)
+
+            send_to_bedrock = interaction.send_to_bedrock
+            def timed_send(*a, **kw):
+                timer.next_step()
+                serialization = client.serialization_seconds
+                start = perf_counter()
+                try:
+                    return send_to_bedrock(*a, **kw)
+                finally:
+                    timer.add("bedrock", perf_counter() - start)
+                    timer.add("serialization", client.serialization_seconds - serialization)
+            interaction.send_to_bedrock = timed_send
+
+            interaction.main_loop(args.prompt, interactive=False)
+            timer.next_step()
+            timer.current = None
+            interaction.close()
+            computer_use.close()
+        timer.report()
+    finally:
+        if display is not None:
+            display.stop()
+
+if __name__ == "__main__":
+    main()
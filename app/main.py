@@ -1,85 +1,129 @@
+# first, so the startup clock includes the imports below
+from agent.startup import startup
 from io import BytesIO
+import argparse
+import json
 import logging
-import boto3
 import platform
+import threading
 from botocore.exceptions import ClientError
-from botocore.config import Config
-from time import sleep
+from time import monotonic, sleep
 from datetime import datetime
 
 import sys
 
-from pprint import pformat
 import os
 import sys
 
-from tool_use.computer_use import ComputerUse
+from tool_use.computer_use import ComputerUse, ScreenshotSettings
 from tool_use.s3_upload import S3Upload
+from agent.history import ConversationHistory
+from agent.rate_limiter import RateLimiter
+from agent.streaming import StreamAssembler
+from agent.prompt_cache import PromptCache
+from agent.tool_scheduler import ToolScheduler
+from agent.metrics import metrics
+from agent.aws_clients import clients
+from agent.checkpoint import Checkpoint
+from agent.trajectory_cache import TrajectoryCache
+from agent.logging_setup import LazyPformat, configure_logging
 
-# main thread logging config
+# main thread logging config: records are formatted and written by a background listener
 LOG_OUTPUT_FOLDER = os.environ.get("LOG_OUTPUT_FOLDER", os.path.dirname(__file__) + "/logs")
-fileHandler = logging.FileHandler(f"{LOG_OUTPUT_FOLDER}/{os.path.basename(__file__)}.log")
-consoleHandler = logging.StreamHandler()
-logging.basicConfig(
-    format="%(asctime)s [%(filename)s:%(lineno)s - %(funcName)10s() ] %(message)s",
-    datefmt="%Y-%m-%d:%H:%M:%S",
-    force=True,
-    handlers=[
-        fileHandler,
-        consoleHandler
-    ]
-    )
-
-fileHandler.setLevel(logging.DEBUG)
-# logging.getLogger().addHandler(fileHandler)
-
-consoleHandler.setLevel(logging.INFO)
-# logging.getLogger().addHandler(consoleHandler)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG").upper()
+configure_logging(LOG_OUTPUT_FOLDER, os.path.basename(__file__), file_level=LOG_LEVEL)
 
-logging.getLogger("tool_use.computer_use").setLevel(logging.DEBUG)
-logging.getLogger("tool_use.s3_upload").setLevel(logging.DEBUG)
+logging.getLogger("tool_use").setLevel(LOG_LEVEL)
+logging.getLogger("agent").setLevel(LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger.setLevel(LOG_LEVEL)
     
 class BedrockComputerInteraction:
-    def __init__(self, region_name, model_id, system, tool_config, additional_request_fields):
-        boto3_config = Config(
-            region_name = 'us-east-1',
-            signature_version = 'v4',
-            retries = {
-                'max_attempts': 1,
-                'mode': 'standard'
-            }
-        )
-        session = boto3.Session(
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            aws_session_token=os.environ.get('AWS_SESSION_TOKEN')
-        )
-        self.client = session.client("bedrock-runtime", config=boto3_config)
+    def __init__(self, region_name, model_id, system, tool_config, additional_request_fields, rate_limiter=None, client=None, computer_use=None, checkpoint=None):
+        """`client`, `rate_limiter` and `computer_use` can be passed in to share them between concurrent sessions.
+
+        Messages are logged to `checkpoint`, by default a new session under CHECKPOINT_FOLDER
+        unless CHECKPOINT_ENABLED=false."""
+        self.client = client or self.create_client(region_name)
+        if os.environ.get("BEDROCK_RECORD_TRAJECTORY"):
+            # replayable offline with agent.local_aws.ReplayBedrockClient
+            from agent.local_aws import RecordingBedrockClient
+            self.client = RecordingBedrockClient(self.client, os.environ["BEDROCK_RECORD_TRAJECTORY"])
         # self.client = boto3.client('bedrock-runtime', region_name=region_name)
         self.model_id = model_id
         self.system = system
         self.tool_config = tool_config
         self.additional_request_fields = additional_request_fields
         self.messages = []
-        self.THROTTLING_DELAY_SECONDS=int(os.environ.get("THROTTLING_DELAY_SECONDS",10))
+        if checkpoint is None and os.environ.get("CHECKPOINT_ENABLED", "true").lower() == "true":
+            checkpoint = Checkpoint()
+        self.checkpoint = checkpoint
+        self.history = ConversationHistory(
+            base_tokens=len(json.dumps([system, tool_config, additional_request_fields], default=str)) // ConversationHistory.CHARS_PER_TOKEN
+        )
+        # optional fixed delay before every call; pacing is normally left to the rate limiter
+        self.THROTTLING_DELAY_SECONDS=int(os.environ.get("THROTTLING_DELAY_SECONDS",0))
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.streaming = os.environ.get("BEDROCK_STREAMING", "false").lower() == "true"
+        self.prompt_cache = PromptCache()
+        self.usage = {'inputTokens': 0, 'outputTokens': 0, 'cacheReadInputTokens': 0, 'cacheWriteInputTokens': 0}
+
+        self.tool_use_s3_upload = S3Upload(region_name=region_name)
+        # TLS setup and credential resolution overlap with the display and screen setup
+        clients.warm_up(self.client, self.tool_use_s3_upload.client)
+        self.computer_use = computer_use or ComputerUse()
+        self.tool_scheduler = ToolScheduler(lambda toolUse: self.execute_tool(toolUse))
+        self.trajectory_cache = TrajectoryCache() if os.environ.get("TRAJECTORY_CACHE_ENABLED", "false").lower() == "true" else None
+        # the run being recorded for the trajectory cache, and screen hashes by toolUseId
+        self.trajectory = None
+        self.step_hashes = {}
 
-        self.computer_use = ComputerUse()
-        self.tool_use_s3_upload = S3Upload()
+    @staticmethod
+    def create_client(region_name, max_pool_connections=10):
+        return clients.client("bedrock-runtime", region_name, max_pool_connections=max_pool_connections)
 
-    def send_to_bedrock(self):
-        """Send messages to Bedrock and get the response using boto3."""
+    def send_to_bedrock(self, on_tool_use=None):
+        """Send messages to Bedrock and get the response using boto3.
+
+        In streaming mode `on_tool_use` is called with each toolUse block as soon as it is complete."""
         try:            
-            sleep(self.THROTTLING_DELAY_SECONDS)
-            response = self.client.converse(
+            if self.THROTTLING_DELAY_SECONDS:
+                sleep(self.THROTTLING_DELAY_SECONDS)
+            if self.history.compact(self.messages) and not self.history.has_images(self.messages):
+                # the model has no screenshot left to compare an "unchanged" result against
+                self.computer_use.screenshot.last_sent_hash = None
+            estimated_tokens, estimated_bytes = self.history.estimate(self.messages)
+            request = dict(
                 modelId=self.model_id,
-                messages=self.messages,
-                system=self.system,
-                toolConfig=self.tool_config,
+                messages=self.prompt_cache.messages(self.messages),
+                system=self.prompt_cache.system(self.system),
+                toolConfig=self.prompt_cache.tool_config(self.tool_config),
                 additionalModelRequestFields=self.additional_request_fields
             )
+            with metrics.span("bedrock.converse", streaming=self.streaming) as span:
+                span['bytes'] = estimated_bytes
+                if self.streaming:
+                    started = []
+                    def dispatch(toolUse):
+                        started.append(toolUse['toolUseId'])
+                        if on_tool_use is not None:
+                            on_tool_use(toolUse)
+                    def converse_stream():
+                        stream_response = self.client.converse_stream(**request)
+                        return StreamAssembler(dispatch).assemble(stream_response['stream'])
+                    # errors in the middle of the stream are retried too, until a tool has started:
+                    # asking again would then run it a second time
+                    response = self.rate_limiter.call(converse_stream, estimated_tokens, can_retry=lambda: not started)
+                else:
+                    response = self.rate_limiter.call(lambda: self.client.converse(**request), estimated_tokens)
+                span.update(response.get('usage', {}))
+                span.update(response.get('metrics', {}))
+            metrics.record_bedrock_response(response)
+            self.prompt_cache.record(response.get('usage'))
+            for key, value in response.get('usage', {}).items():
+                if key in self.usage:
+                    self.usage[key] += value
             return response
         except ClientError as e:
             # Check if the error is a ThrottlingException
@@ -91,42 +135,176 @@ class BedrockComputerInteraction:
             return None
         except Exception as e:
             for i, messages in enumerate(self.messages):
-                logger.error(f"message {i}:")
-                logger.error(pformat(messages))
+                logger.error("message %d:\n%s", i, LazyPformat(messages))
             logger.exception(f"Error communicating with Bedrock: {e}")
             return None
 
     def add_message(self, role, content):
         """Add a message to the conversation history, schema following https://boto3.amazonaws.com/v1/documentation/api/1.35.8/reference/services/bedrock-runtime/client/converse.html."""
         self.messages.append({"role": role, "content": content})
+        if self.checkpoint is not None:
+            self.checkpoint.append(self.messages[-1])
+
+    def resume(self, checkpoint):
+        """Continue the session logged in `checkpoint`; only the screenshots history keeps are read back."""
+        self.checkpoint = checkpoint
+        self.messages = checkpoint.load(keep_images=self.history.keep_images)
 
     def get_tool_use(self, content):
         for item in content:
             if 'toolUse' in item:
                 yield item['toolUse']
 
-    def main_loop(self, user_input=None):
-        print("Welcome to the Bedrock Interaction Script.")
+    def execute_tool(self, toolUse):
+        tool_name = toolUse['name']
+        match tool_name:
+            case "computer":
+                tool_result = self.computer_use.handle(toolUse)
+                if self.trajectory is not None:
+                    self.step_hashes[toolUse['toolUseId']] = self.observe_screen(toolUse['input'])
+                return tool_result
+            case self.tool_use_s3_upload.TOOLSPECNAME_UPLOAD_FILE:
+                return self.tool_use_s3_upload.upload_file(toolUse)
+            case self.tool_use_s3_upload.TOOLSPECNAME_UPLOAD_MEMORY:
+                return self.tool_use_s3_upload.upload_object(toolUse)
+            case self.tool_use_s3_upload.TOOLSPECNAME_UPLOAD_DIRECTORY:
+                return self.tool_use_s3_upload.upload_directory(toolUse)
+            case _:
+                logger.exception(f"Unknown input: {toolUse}")
+                tool_use_id = toolUse['toolUseId']
+                # dummy response
+                return {
+                    'toolResult': {
+                        'toolUseId': tool_use_id,
+                        'content':[{'text': 'OK'}
+                        ]
+                    }
+                }
+
+    def observe_screen(self, input_data=None):
+        """BlockHash of the settled screen after a tool call."""
+        screenshot = self.computer_use.screenshot
+        if input_data is None or input_data.get('action') in (None, 'screenshot'):
+            # actions wait for the screen themselves, commands and screenshots do not
+            screenshot.wait_for_settle()
+        return screenshot.settled_hash
+
+    def start_task(self, user_input):
+        """Add the initial task; with the trajectory cache, first replay a recorded run of it.
+
+        Returns an end_turn response standing in for the model when the whole
+        recorded run replayed with matching screens. Otherwise the task goes to
+        the model, with a list of the replayed steps if a partial replay
+        happened first.
+        """
+        if self.trajectory_cache is None:
+            self.add_message(role="user", content=[{"text": user_input}])
+            return None
+        start_hash = self.observe_screen()
+        self.trajectory = {'task': user_input, 'start': start_hash, 'steps': []}
+        entry = self.trajectory_cache.lookup(user_input, start_hash)
+        if entry is None:
+            self.add_message(role="user", content=[{"text": user_input}])
+            return None
+        with metrics.span("trajectory.replay") as span:
+            replayed, diverged = self.replay_trajectory(entry['steps'])
+            span['steps'] = replayed
+            span['diverged'] = diverged
+        if not diverged:
+            self.add_message(role="user", content=[{"text": user_input}])
+            return {
+                'output': {'message': {'role': 'assistant', 'content': [{'text': entry['final_message'] or 'Done.'}]}},
+                'stopReason': 'end_turn',
+                'usage': {}
+            }
+        summary = "\n".join(f"- {step['name']}: {json.dumps(step['input'], default=str)[:200]}" for step in self.trajectory['steps'])
+        self.add_message(role="user", content=[
+            {"text": user_input},
+            {"text": f"[The first {replayed} steps of this task were already carried out by repeating an earlier run:\n{summary}\n"
+                     f"After the last of them the screen no longer matched the earlier run. Take a screenshot and continue from there.]"}
+        ])
+        return None
+
+    def replay_trajectory(self, steps):
+        """Run recorded steps until a screen differs from the recording; returns (steps run, diverged)."""
+        for i, step in enumerate(steps):
+            toolUse = {'toolUseId': f"replay-{i}", 'name': step['name'], 'input': step['input']}
+            if step['name'] == 'computer' and step['input'].get('action') == 'screenshot':
+                # nobody to look at it, only the screen check matters
+                tool_result = None
+                observed = self.observe_screen(step['input'])
+            else:
+                tool_result = self.execute_tool(toolUse)
+                observed = self.step_hashes.pop(toolUse['toolUseId'], None)
+            self.trajectory['steps'].append({'name': step['name'], 'input': step['input'], 'hash': observed})
+            if tool_result is not None and tool_result['toolResult'].get('status') == 'error':
+                logger.info(f"replayed step {i + 1} failed, continuing live")
+                return i + 1, True
+            if step['hash'] is not None:
+                difference = observed.difference(step['hash'])
+                if difference > self.trajectory_cache.threshold:
+                    logger.info(f"screen after replayed step {i + 1} differs by {difference:.4f}, continuing live")
+                    return i + 1, True
+        logger.info(f"replayed all {len(steps)} steps from the trajectory cache")
+        return len(steps), False
+
+    def main_loop(self, user_input=None, interactive=True, max_steps=None, max_seconds=None):
+        """Run the conversation and return a summary of how it ended.
 
-        if not user_input:
-            user_input = input("Please enter your initial input: ")
+        When not `interactive`, the session ends at the first end_turn instead of
+        asking for more input. `max_steps` limits the number of Bedrock calls and
+        `max_seconds` the wall time; both are checked before each call.
+        """
+        start = monotonic()
+        steps = 0
+        outcome = None
+        if interactive:
+            print("Welcome to the Bedrock Interaction Script.")
 
-        logger.info(f'user_input:{user_input}')
-        # Add the initial user input
-        self.add_message(role="user", content=[{"text": user_input}])
+        cached_response = None
+        if self.messages and self.messages[-1]['role'] == 'user':
+            # resumed mid-task, the next step is to ask the model again
+            logger.info(f"resuming after {len(self.messages)} messages")
+        else:
+            if not user_input:
+                if not interactive:
+                    raise ValueError("an unattended session needs a non-empty task")
+                user_input = input("Please enter your initial input: ")
+
+            logger.info(f'user_input:{user_input}')
+            # Add the initial user input
+            cached_response = self.start_task(user_input)
 
         while True:
-            # Step 1: Send messages to Bedrock
-            bedrock_response = self.send_to_bedrock()
+            if max_steps is not None and steps >= max_steps:
+                logger.warning(f"Step budget of {max_steps} exhausted. Exiting.")
+                outcome = "max_steps"
+                break
+            if max_seconds is not None and monotonic() - start >= max_seconds:
+                logger.warning(f"Time budget of {max_seconds}s exhausted. Exiting.")
+                outcome = "timeout"
+                break
+
+            # Step 1: Send messages to Bedrock, in streaming mode tools start running as their blocks complete
+            dispatched = {}
+            def on_tool_use(toolUse):
+                dispatched[toolUse['toolUseId']] = self.tool_scheduler.submit(toolUse)
+            if cached_response is not None:
+                # the trajectory cache replayed the whole task
+                bedrock_response, cached_response = cached_response, None
+            else:
+                bedrock_response = self.send_to_bedrock(on_tool_use)
+                steps += 1
+            metrics.flush()
 
             if not bedrock_response:
                 logger.exception("Failed to get a response from Bedrock. Exiting.")
+                outcome = "bedrock_error"
                 break
 
-            logger.debug(f'bedrock_response:{bedrock_response}')
-            logger.debug( pformat(bedrock_response) )
+            logger.debug("bedrock_response:\n%s", LazyPformat(bedrock_response))
 
-            if bedrock_response.get('output') and bedrock_response.get('output').get('message') and bedrock_response.get('output').get('message').get('content'):
+            if not self.streaming and bedrock_response.get('output') and bedrock_response.get('output').get('message') and bedrock_response.get('output').get('message').get('content'):
                 for item in bedrock_response.get('output').get('message').get('content'):
                     message_content = item.get('text')
                     if message_content:
@@ -142,26 +320,15 @@ class BedrockComputerInteraction:
             tool_result_contents=[]
             match stop_reason:
                 case "tool_use":
-                    for toolUse in self.get_tool_use(message_content):
-                        tool_name = toolUse['name']
-                        match tool_name:
-                            case "computer":
-                                tool_result_contents.append(self.computer_use.handle(toolUse))
-                            case self.tool_use_s3_upload.TOOLSPECNAME_UPLOAD_FILE:
-                                tool_result_contents.append(self.tool_use_s3_upload.upload_file(toolUse))
-                            case self.tool_use_s3_upload.TOOLSPECNAME_UPLOAD_MEMORY:
-                                tool_result_contents.append(self.tool_use_s3_upload.upload_object(toolUse))
-                            case _:
-                                logger.exception(f"Unknown input: {toolUse}")
-                                tool_use_id = toolUse['toolUseId']
-                                # dummy response
-                                tool_result_contents.append({
-                                    'toolResult': {
-                                        'toolUseId': tool_use_id,
-                                        'content':[{'text': 'OK'}
-                                        ]
-                                    }
-                                })
+                    # GUI actions run in order, other tools concurrently; results keep the toolUse order
+                    tool_result_contents = self.tool_scheduler.results(self.get_tool_use(message_content), dispatched)
+                    if self.trajectory is not None:
+                        for toolUse in self.get_tool_use(message_content):
+                            self.trajectory['steps'].append({
+                                'name': toolUse['name'],
+                                'input': toolUse['input'],
+                                'hash': self.step_hashes.pop(toolUse['toolUseId'], None)
+                            })
                     # Add assistant message and user tool result
                     self.add_message(role="assistant", content=message_content)
                     self.add_message(role="user", content=tool_result_contents)
@@ -169,22 +336,54 @@ class BedrockComputerInteraction:
                     # Step 4: Reply to user and get new input or exit
                     logger.info(f"Bedrock: {message_content}")
                     self.add_message(role="assistant", content=message_content)
+                    outcome = "end_turn"
+                    if self.trajectory is not None:
+                        # only the run up to the first end_turn answers the cached task
+                        self.trajectory_cache.store(
+                            self.trajectory['task'], self.trajectory['start'], self.trajectory['steps'], self.last_assistant_text()
+                        )
+                        self.trajectory = None
+                    if not interactive:
+                        break
                     user_input = input("Your response (or type 'exit' to end): ")
                     if user_input.lower() == "exit":
                         print("Ending the interaction. Goodbye!")
                         break
                     elif user_input:
                         self.add_message(role="user", content=[{"text": user_input}])
+                        outcome = None
                     else:
                         break
                 case _:
                     # Handle other stop reasons if necessary
                     logger.exception(f"Unexpected stop reason: {stop_reason}")
+                    outcome = f"stop_reason:{stop_reason}"
                     break
 
-if __name__ == "__main__":
-    REGION_NAME = "us-east-1"  # Replace with your region
-    MODEL_ID = 'us.anthropic.claude-3-5-sonnet-20241022-v2:0'
+        return {
+            'outcome': outcome,
+            'steps': steps,
+            'latency_seconds': round(monotonic() - start, 3),
+            'usage': dict(self.usage),
+            'final_message': self.last_assistant_text()
+        }
+
+    def close(self):
+        self.tool_scheduler.close()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+
+    def last_assistant_text(self):
+        for message in reversed(self.messages):
+            if message['role'] == 'assistant':
+                return '\n'.join(block['text'] for block in message['content'] if block.get('text'))
+        return None
+
+REGION_NAME = os.environ.get("AWS_REGION", "us-east-1")  # Replace with your region
+MODEL_ID = 'us.anthropic.claude-3-5-sonnet-20241022-v2:0'
+
+def build_request_config(display=None):
+    """Return (SYSTEM, TOOL_CONFIG, ADDITIONAL_REQUEST_FIELDS) for a session on X display `display`."""
     SYSTEM = [{'text': f"""<SYSTEM_CAPABILITY>
 * You are utilising an Ubuntu virtual machine using {platform.machine()} architecture with internet access.
 * To open web browser, please just click on the firefox icon.  Note, firefox-esr is what is installed on your system.
@@ -208,30 +407,80 @@ if __name__ == "__main__":
         'tools': [*S3Upload.TOOLSPEC]
     }
     logger.debug(f"TOOL_CONFIG: {TOOL_CONFIG}")
+    # the model sees, and answers in, the possibly downscaled screenshot resolution
+    SCREENSHOT_SETTINGS = ScreenshotSettings()
     ADDITIONAL_REQUEST_FIELDS = {
             "tools": [
                 {
                     # https://docs.anthropic.com/en/docs/build-with-claude/computer-use#computer-tool
                     "type": "computer_20241022",
                     "name": "computer",
-                    "display_height_px": int(os.environ.get("HEIGHT",768)),
-                    "display_width_px": int(os.environ.get("WIDTH",1024)),
-                    "display_number": int(os.environ.get("DISPLAY",':0')[1:])
+                    "display_height_px": SCREENSHOT_SETTINGS.model_height,
+                    "display_width_px": SCREENSHOT_SETTINGS.model_width,
+                    "display_number": int((display or os.environ.get("DISPLAY",':0'))[1:])
                 }
             ],
             "anthropic_beta": ["computer-use-2024-10-22"]
         }
     
     logger.debug(f"ADDITIONAL_REQUEST_FIELDS: {ADDITIONAL_REQUEST_FIELDS}")
+    return SYSTEM, TOOL_CONFIG, ADDITIONAL_REQUEST_FIELDS
+
+def prepare_clients(region_name):
+    """Import boto3 and create and warm the shared Bedrock and S3 clients on a background thread.
+
+    BedrockComputerInteraction picks the same clients up from agent.aws_clients,
+    so this only moves the work to where it overlaps with waiting for the display.
+    """
+    def prepare():
+        start = monotonic()
+        try:
+            clients.warm_up(BedrockComputerInteraction.create_client(region_name), S3Upload(region_name=region_name).client)
+        except Exception as e:
+            # raised again, on the main thread, when the session creates them
+            logger.debug(f"preparing AWS clients failed: {e}")
+        startup.record("aws clients", monotonic() - start)
+    thread = threading.Thread(target=prepare, name="prepare-clients", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Computer use agent on Amazon Bedrock")
+    parser.add_argument("prompt", nargs="?", help="initial task, asked for interactively when omitted")
+    parser.add_argument("--resume", nargs="?", const="latest", metavar="CHECKPOINT",
+                        help="continue a session from its checkpoint log, by default the most recent one")
+    args = parser.parse_args()
+
+    checkpoint = None
+    if args.resume:
+        checkpoint = Checkpoint.latest() if args.resume == "latest" else Checkpoint.from_path(args.resume)
+        if checkpoint is None or not os.path.exists(checkpoint.path):
+            parser.error(f"no checkpoint found for --resume {args.resume}")
+
+    startup.mark("imports")
+    preparing = prepare_clients(REGION_NAME)
+    computer_use = ComputerUse()
+    startup.mark("display")
+    preparing.join()
+    startup.mark("aws")
+
+    SYSTEM, TOOL_CONFIG, ADDITIONAL_REQUEST_FIELDS = build_request_config()
 
     interaction = BedrockComputerInteraction(
         region_name=REGION_NAME,
         model_id=MODEL_ID,
         system=SYSTEM,
         tool_config=TOOL_CONFIG,
-        additional_request_fields=ADDITIONAL_REQUEST_FIELDS
+        additional_request_fields=ADDITIONAL_REQUEST_FIELDS,
+        computer_use=computer_use,
+        checkpoint=checkpoint
     )
-    if len(sys.argv) > 1:
-        interaction.main_loop(sys.argv[1])
-    else:
-        interaction.main_loop()
+    startup.mark("session")
+    startup.report()
+    try:
+        if checkpoint is not None:
+            interaction.resume(checkpoint)
+        interaction.main_loop(args.prompt)
+    finally:
+        interaction.close()
+        computer_use.close()
@@ -0,0 +1,104 @@
+"""Run several computer use sessions concurrently, each on its own Xvfb display.
+
+    python3 app/orchestrator.py --sessions 4 "first task" "second task" ...
+
+Every session gets its own display, ComputerUse and log folder, while all of
+them share one pooled bedrock-runtime client and one RateLimiter, so the
+configured BEDROCK_MAX_RPM/BEDROCK_MAX_TPM quota applies to the node as a whole.
+"""
+import argparse
+import itertools
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.aws_clients import clients
+from agent.displays import XvfbDisplay
+from agent.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+class Orchestrator:
+    def __init__(self, sessions, base_display=None):
+        self.sessions = sessions
+        base_display = base_display if base_display is not None else int(os.environ.get("ORCHESTRATOR_BASE_DISPLAY", 10))
+        self.displays = [XvfbDisplay(base_display + i) for i in range(sessions)]
+        self.free_displays = queue.Queue()
+        self.log_folder = os.environ.get("LOG_OUTPUT_FOLDER", os.path.dirname(__file__) + "/logs")
+        self.session_ids = itertools.count()
+        self.session_ids_lock = threading.Lock()
+
+    def start(self):
+        with ThreadPoolExecutor(len(self.displays)) as pool:
+            list(pool.map(lambda display: display.start(), self.displays))
+        for display in self.displays:
+            self.free_displays.put(display)
+        # pyautogui connects to $DISPLAY when it is first imported
+        os.environ.setdefault("DISPLAY", self.displays[0].name)
+        import main
+        self.main = main
+        self.client = main.BedrockComputerInteraction.create_client(main.REGION_NAME, max_pool_connections=2 * self.sessions)
+        # one connection per session, the first steps of all sessions are sent together
+        clients.warm_up(self.client, connections=self.sessions)
+        self.rate_limiter = RateLimiter()
+        return self
+
+    def stop(self):
+        for display in self.displays:
+            display.stop()
+
+    def run_task(self, task, max_steps=None, max_seconds=None):
+        """Run one task on the next free display and return the main_loop summary, plus the display used."""
+        from tool_use.computer_use import ComputerUse
+        with self.session_ids_lock:
+            session_id = next(self.session_ids)
+        log_folder = f"{self.log_folder}/session_{session_id}"
+        os.makedirs(log_folder, exist_ok=True)
+        display = self.free_displays.get()
+        try:
+            logger.info(f"session {session_id} on display {display.name}: {task}")
+            computer_use = ComputerUse(display.name, log_folder)
+            try:
+                system, tool_config, additional_request_fields = self.main.build_request_config(display.name)
+                interaction = self.main.BedrockComputerInteraction(
+                    region_name=self.main.REGION_NAME,
+                    model_id=self.main.MODEL_ID,
+                    system=system,
+                    tool_config=tool_config,
+                    additional_request_fields=additional_request_fields,
+                    rate_limiter=self.rate_limiter,
+                    client=self.client,
+                    computer_use=computer_use
+                )
+                try:
+                    result = interaction.main_loop(task, interactive=False, max_steps=max_steps, max_seconds=max_seconds)
+                finally:
+                    interaction.close()
+                result['display'] = display.name
+                result['log_folder'] = log_folder
+                return result
+            finally:
+                computer_use.close()
+        finally:
+            self.free_displays.put(display)
+
+    def run(self, tasks):
+        """Run `tasks` on the display pool, at most one per display at a time."""
+        with ThreadPoolExecutor(self.sessions) as pool:
+            return list(pool.map(self.run_task, tasks))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=int(os.environ.get("ORCHESTRATOR_SESSIONS", os.cpu_count() or 1)))
+    parser.add_argument("tasks", nargs="+")
+    args = parser.parse_args()
+
+    orchestrator = Orchestrator(min(args.sessions, len(args.tasks)))
+    try:
+        orchestrator.start()
+        orchestrator.run(args.tasks)
+    finally:
+        orchestrator.stop()
@@ -1,60 +1,277 @@
 from io import BytesIO
 import logging
-from botocore.exceptions import ClientError
-from botocore.config import Config
 from time import sleep
 from datetime import datetime
 
 import sys
-import subprocess
+import threading
+from contextlib import contextmanager
 
 from pprint import pformat
-import Xlib.display
-import pyautogui
 import os
 import sys
-if(os.environ.get('DISPLAY')):
-    pyautogui._pyautogui_x11._display = Xlib.display.Display(os.environ.get('DISPLAY'))
 
-class SaveScreenshot:
+from .screenshot_writer import ScreenshotWriter
+from .video_recorder import VideoRecorder
+from .x11_capture import Frame, X11Capture
+from .frame_hash import BlockHash
+from .screen_settle import ScreenSettle
+from .shell_session import ShellSession
+from .x11_input import X11Input
+from agent.displays import wait_for_display
+from agent.metrics import metrics
+from agent.startup import LazyModule, preload
+
+# importing pyautogui connects to $DISPLAY, so it is left until the display is up
+pyautogui = LazyModule("pyautogui")
+
+# only for displays without XTEST: pyautogui drives whichever connection is in
+# this module global, so sessions swap theirs in under this lock for each call
+_pyautogui_display_lock = threading.RLock()
+
+class ScreenshotSettings:
+    """Format, quality and resolution of the screenshots sent to the model.
+
+    The model works in the scaled coordinate space, so coordinates it returns
+    are mapped back to the real WIDTH x HEIGHT display with `to_screen`.
+    """
+    FORMATS = {'png': 'PNG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
     def __init__(self):
-        self.image_location = os.environ.get("LOG_OUTPUT_FOLDER", os.path.dirname(__file__) + "/logs")
+        self.format = os.environ.get("SCREENSHOT_FORMAT", "png").lower()
+        if self.format == 'jpg':
+            self.format = 'jpeg'
+        if self.format not in self.FORMATS:
+            raise ValueError(f"Unsupported SCREENSHOT_FORMAT: {self.format}")
+        self.quality = int(os.environ.get("SCREENSHOT_QUALITY", 80))
+        self.screen_width = int(os.environ.get("WIDTH", 1024))
+        self.screen_height = int(os.environ.get("HEIGHT", 768))
+        model_width = os.environ.get("MODEL_SCREEN_WIDTH")
+        model_height = os.environ.get("MODEL_SCREEN_HEIGHT")
+        # a single dimension keeps the display's aspect ratio
+        if model_width and not model_height:
+            model_height = round(int(model_width) * self.screen_height / self.screen_width)
+        elif model_height and not model_width:
+            model_width = round(int(model_height) * self.screen_width / self.screen_height)
+        self.model_width = int(model_width or self.screen_width)
+        self.model_height = int(model_height or self.screen_height)
+
+    @property
+    def scaled(self):
+        return (self.model_width, self.model_height) != (self.screen_width, self.screen_height)
+
+    def to_screen(self, coordinate):
+        if not self.scaled:
+            return coordinate
+        x, y = coordinate
+        return [round(x * self.screen_width / self.model_width),
+                round(y * self.screen_height / self.model_height)]
+
+    def scale(self, image):
+        if image.size != (self.model_width, self.model_height):
+            from PIL import Image
+            image = image.resize((self.model_width, self.model_height), Image.Resampling.BILINEAR)
+        return image
+
+    def encode(self, image):
+        with metrics.span("screenshot.encode", format=self.format) as span:
+            buffer = BytesIO()
+            if self.format == 'png':
+                image.save(buffer, format='PNG')
+            else:
+                image.save(buffer, format=self.FORMATS[self.format], quality=self.quality)
+            image_bytes = buffer.getvalue()
+            buffer.close()
+            span['bytes'] = len(image_bytes)
+        return image_bytes
+
+class SaveScreenshot:
+    def __init__(self, capture=None, settings=None, image_location=None):
+        self.capture = capture
+        self.settings = settings or ScreenshotSettings()
+        self.image_location = image_location or os.environ.get("LOG_OUTPUT_FOLDER", os.path.dirname(__file__) + "/logs")
         self.counter=0
         self.logger = logging.getLogger(__name__)
-    
-    def get_and_save_screen_shot(self):
-        screenshot = pyautogui.screenshot()
-        buffer = BytesIO()
-        screenshot.save(buffer, format='PNG')
-        screenshot_filename=f"{self.image_location}/screen_shot_{self.counter}.png"
+        self.writer = ScreenshotWriter()
+        # fraction of changed blocks at or below which a frame counts as unchanged
+        self.dedup_threshold = float(os.environ.get("SCREENSHOT_DEDUP_THRESHOLD", 0))
+        self.dedup_enabled = os.environ.get("SCREENSHOT_DEDUP", "true").lower() == "true"
+        # send only the changed region when it covers at most this fraction of the screen, 0 disables
+        self.dirty_rect_max_area = float(os.environ.get("SCREENSHOT_DIRTY_RECT_MAX_AREA", 0))
+        self.last_sent_hash = None
+        # without X11Capture every sample is a full pyautogui.screenshot(), too slow to poll
+        self.settle = ScreenSettle(self.sample, single=capture is None)
+        self.settled_hash = None
+        self.log_after_action = os.environ.get("SCREENSHOT_LOG_AFTER_ACTION", "false").lower() == "true"
+        self.recorder = None
+        if os.environ.get("SESSION_VIDEO", "true").lower() == "true":
+            try:
+                self.recorder = VideoRecorder(self.image_location)
+            except (RuntimeError, ValueError) as e:
+                self.logger.warning(f"session video disabled: {e}")
+        self.recorded_hash = None
+        # encoded screenshots are written as files when there is no video, or when asked for
+        self.log_files = os.environ.get("SCREENSHOT_LOG_FILES", "false" if self.recorder is not None else "true").lower() == "true"
+
+    def sample(self):
+        """Capture the screen and return its BlockHash with the raw frame."""
+        if self.capture is not None:
+            frame = self.capture.capture()
+            frame_hash = BlockHash.from_frame(frame)
+        else:
+            frame = pyautogui.screenshot()
+            frame_hash = BlockHash.from_image(frame)
+        if self.recorder is not None and frame_hash != self.recorded_hash:
+            # the video only needs frames that differ, their timestamps carry the rest
+            self.recorded_hash = frame_hash
+            self.recorder.add_frame(frame)
+        return frame_hash, frame
+
+    @staticmethod
+    def to_image(frame):
+        return frame.to_image() if isinstance(frame, Frame) else frame
+
+    def wait_for_settle(self):
+        """Block until the screen is stable after an action, keeping the hash of the stable frame."""
+        with metrics.span("screenshot.settle") as span:
+            frame_hash, frame, settled = self.settle.wait()
+            span['settled'] = settled
+        self.settled_hash = frame_hash
+        if self.log_after_action:
+            self.save(self.settings.encode(self.settings.scale(self.to_image(frame))))
+        return settled
+
+    def grab(self):
+        """A fresh capture; the settle hash can hide small changes, so its frame is not reused."""
+        with metrics.span("screenshot.capture", backend=self.capture.backend if self.capture is not None else 'pyautogui'):
+            _, frame = self.sample()
+            return self.to_image(frame)
+
+    def save(self, image_bytes):
+        # the same encoded bytes go to the model and, off-thread, to the log folder
+        if not self.log_files:
+            return
+        screenshot_filename=f"{self.image_location}/screen_shot_{self.counter}.{self.settings.format}"
         self.counter+=1
         self.logger.debug(f"saving screenshot to {screenshot_filename}")
-        screenshot.save(screenshot_filename, format='PNG')
-        image_bytes = buffer.getvalue()
-        buffer.close()
-        return image_bytes
+        self.writer.submit(screenshot_filename, image_bytes)
+
+    def image_block(self, image_bytes):
+        return {
+            'image': {
+                'format': self.settings.format,
+                'source': {
+                    'bytes': image_bytes
+                }
+            }
+        }
+
+    def get_tool_result_content(self):
+        """Content blocks answering a screenshot action, skipping frames the model has already seen."""
+        screenshot = self.settings.scale(self.grab())
+        frame_hash = BlockHash.from_image(screenshot)
+        previous_hash, self.last_sent_hash = self.last_sent_hash, frame_hash
+        if self.dedup_enabled and previous_hash is not None:
+            difference = frame_hash.difference(previous_hash)
+            if difference <= self.dedup_threshold:
+                self.logger.debug(f"screen unchanged, difference {difference:.4f}")
+                # keep comparing against the frame the model actually has
+                self.last_sent_hash = previous_hash
+                return [{'text': 'Screen unchanged since last screenshot'}]
+            if self.dirty_rect_max_area > 0:
+                left, top, right, bottom = frame_hash.dirty_rect(previous_hash, *screenshot.size)
+                if (right - left) * (bottom - top) <= self.dirty_rect_max_area * screenshot.size[0] * screenshot.size[1]:
+                    image_bytes = self.settings.encode(screenshot.crop((left, top, right, bottom)))
+                    self.save(image_bytes)
+                    return [
+                        {'text': f'Only the region from ({left}, {top}) to ({right}, {bottom}) changed since last screenshot; this image shows that region'},
+                        self.image_block(image_bytes)
+                    ]
+        image_bytes = self.settings.encode(screenshot)
+        self.save(image_bytes)
+        return [
+            {'text': 'OK'},
+            self.image_block(image_bytes)
+        ]
+
+    def close(self):
+        self.writer.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.capture is not None:
+            self.capture.close()
     
 class ComputerUse:
-    def __init__(self):
-        self.screenshot = SaveScreenshot()
+    def __init__(self, display=None, log_folder=None):
+        """Drive X display `display` (e.g. ':1'), or $DISPLAY when None.
+
+        Waits up to DISPLAY_WAIT_SECONDS (default 30) for the X server to accept connections.
+        """
         self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.DEBUG)
-        self.logger.debug("ComputerUse initialized")
+        self.display_name = display or os.environ.get('DISPLAY')
+        self.display = None
+        if self.display_name:
+            self.display = wait_for_display(self.display_name, timeout=float(os.environ.get("DISPLAY_WAIT_SECONDS", 30)))
+        capture = None
+        if self.display is not None:
+            try:
+                capture = X11Capture(self.display,
+                                     use_shm=os.environ.get("SCREENSHOT_USE_SHM", "true").lower() == "true")
+            except Exception as e:
+                # pyautogui.screenshot() always grabs $DISPLAY, not necessarily the display bound here
+                self.logger.warning(f"X11 capture unavailable, falling back to pyautogui.screenshot(): {e}")
+        self.screenshot = SaveScreenshot(capture, image_location=log_folder)
+        self.input = None
+        if self.display is not None:
+            try:
+                self.input = X11Input(self.display, self.display_name)
+            except Exception as e:
+                self.logger.warning(f"XTest input unavailable, falling back to pyautogui for keyboard and mouse: {e}")
+        if self.display is not None and (capture is None or self.input is None):
+            # the import opens a second connection, do it now rather than on the first fallback call
+            preload(pyautogui)
+        self.shell = ShellSession(env={**os.environ, 'DISPLAY': self.display_name} if self.display_name else None)
+        # tool calls handled, numbered in the session video index
+        self.steps = 0
+        self.logger.debug(f"ComputerUse initialized on display {self.display_name}")
+
+    @contextmanager
+    def pyautogui_display(self):
+        """Point pyautogui at this instance's display for the duration of the block; the fallback when XTest is unavailable."""
+        with _pyautogui_display_lock:
+            if self.display is not None:
+                pyautogui._pyautogui_x11._display = self.display
+            yield
+
+    def close(self):
+        self.shell.close()
+        if self.input is not None:
+            self.input.close()
+        self.screenshot.close()
+        if self.display is not None:
+            self.display.close()
 
     def execute_tool_command(self, command, input_data, tool_use_id):
         self.logger.debug(f"Executing tool commnd: {command} for tool_use_id: {tool_use_id}")
 
         self.logger.debug(f"command:{command}, input_data:{input_data}")
-        result = subprocess.run(command, shell=True, stdout=subprocess.PIPE).stdout.decode('utf-8')
-        self.logger.debug(f"result:{result}")
+        result, exit_code, timed_out = self.shell.run(command)
+        self.logger.debug(f"exit_code:{exit_code}, timed_out:{timed_out}, result:{result}")
+        result = result or "(no output)"
+        if timed_out:
+            result += f"\n[command timed out after {self.shell.timeout:g} seconds and was killed"
+            result += "; the shell was restarted, so cwd and environment are reset]" if self.shell.restarted else "; background jobs were left running]"
+        elif exit_code:
+            result += f"\n[exit code {exit_code}]"
         response={
             'toolResult': {
                 'toolUseId': tool_use_id,
                 'content':[
                     {
-                        'text': {result}
+                        'text': result
                     }
-                ]
+                ],
+                'status': 'error' if timed_out or exit_code else 'success'
             }
         }                
 
@@ -72,26 +289,18 @@ class ComputerUse:
                 response={
                     'toolResult': {
                         'toolUseId': tool_use_id,
-                        'content':[
-                            {
-                                'text': 'OK'
-                            },
-                            {
-                                'image': {
-                                    'format': 'png',    
-                                    'source': {
-                                        'bytes': self.screenshot.get_and_save_screen_shot()
-                                    }
-                                }
-                            }                            
-                        ],
+                        'content': self.screenshot.get_tool_result_content(),
                         'status':'success'
                     }
                 }                
             case 'type':
                 text = input_data.get('text')
                 self.logger.debug(f"type:{text}, input_data:{input_data}")
-                pyautogui.write(input_data.get('text'))
+                if self.input is not None:
+                    self.input.type(text)
+                else:
+                    with self.pyautogui_display():
+                        pyautogui.write(text)
                 response={
                     'toolResult': {
                         'toolUseId': tool_use_id,
@@ -105,18 +314,32 @@ class ComputerUse:
             case 'key':
                 key = input_data.get('text')
                 self.logger.debug(f"key:{key}, input_data:{input_data}")
-                if key.lower() == 'return':
-                    key = 'enter'
-                    pyautogui.press(key)
-                elif '_' in key: # for example page_down
-                    key = key.replace("_","").lower()
-                    pyautogui.press(key)
-                elif '+' in key:
-                    keys = key.split('+')
-                    self.logger.debug(f"keys:{keys}, using pyautogui.hotkey()")
-                    pyautogui.hotkey(*keys)
+                if self.input is not None:
+                    try:
+                        self.input.key(key)
+                    except ValueError as e:
+                        self.logger.warning(f"key:{key} rejected: {e}")
+                        return {
+                            'toolResult': {
+                                'toolUseId': tool_use_id,
+                                'content': [{'text': str(e)}],
+                                'status': 'error'
+                            }
+                        }
                 else:
-                    pyautogui.press(input_data.get('text'))
+                    with self.pyautogui_display():
+                        if key.lower() == 'return':
+                            key = 'enter'
+                            pyautogui.press(key)
+                        elif '_' in key: # for example page_down
+                            key = key.replace("_","").lower()
+                            pyautogui.press(key)
+                        elif '+' in key:
+                            keys = key.split('+')
+                            self.logger.debug(f"keys:{keys}, using pyautogui.hotkey()")
+                            pyautogui.hotkey(*keys)
+                        else:
+                            pyautogui.press(input_data.get('text'))
 
                 response={
                     'toolResult': {
@@ -130,8 +353,11 @@ class ComputerUse:
                 }                
             case 'left_click' | 'right_click':
                 self.logger.debug(f"mouse click, input_data:{input_data}")
-                pyautogui.click(button=f'{action.replace("_click","")}')
-                sleep(0.25)
+                if self.input is not None:
+                    self.input.click(action.replace("_click",""))
+                else:
+                    with self.pyautogui_display():
+                        pyautogui.click(button=f'{action.replace("_click","")}')
                 response={
                     'toolResult': {
                         'toolUseId': tool_use_id,
@@ -143,10 +369,13 @@ class ComputerUse:
                     }
                 }                
             case 'left_click_drag' | 'right_click_drag':
-                coordinate = input_data['coordinate']
+                coordinate = self.screenshot.settings.to_screen(input_data['coordinate'])
                 self.logger.debug(f"mouse drag, input_data:{input_data}")
-                pyautogui.dragTo(coordinate[0], coordinate[1], button=f'{action.replace("_click","")}')
-                sleep(0.25)
+                if self.input is not None:
+                    self.input.drag(coordinate[0], coordinate[1], action.replace("_click_drag",""))
+                else:
+                    with self.pyautogui_display():
+                        pyautogui.dragTo(coordinate[0], coordinate[1], button=f'{action.replace("_click_drag","")}')
                 response={
                     'toolResult': {
                         'toolUseId': tool_use_id,
@@ -159,7 +388,11 @@ class ComputerUse:
                 }
             case 'double_click':
                 self.logger.debug(f"double click, input_data:{input_data}")
-                pyautogui.doubleClick()
+                if self.input is not None:
+                    self.input.click('left', clicks=2)
+                else:
+                    with self.pyautogui_display():
+                        pyautogui.doubleClick()
                 response={
                     'toolResult': {
                         'toolUseId': tool_use_id,
@@ -171,11 +404,15 @@ class ComputerUse:
                     }
                 }
             case 'mouse_move':
-                coordinate = input_data['coordinate']
+                coordinate = self.screenshot.settings.to_screen(input_data['coordinate'])
                 self.logger.debug(f"coordinate: {coordinate}, input_data:{input_data}")
                 # coord_str = coordinate.strip('[]')
                 # x, y = map(int, coord_str.split(','))
-                pyautogui.moveTo(coordinate[0],coordinate[1])
+                if self.input is not None:
+                    self.input.move(coordinate[0], coordinate[1])
+                else:
+                    with self.pyautogui_display():
+                        pyautogui.moveTo(coordinate[0],coordinate[1])
                 response={
                     'toolResult': {
                         'toolUseId': tool_use_id,
@@ -190,21 +427,27 @@ class ComputerUse:
                 self.logger.exception("Unsupported action received")
                 raise ValueError(f"Unsupported action received: {action}")
 
-        _ = self.screenshot.get_and_save_screen_shot()
+        if action != 'screenshot':
+            self.screenshot.wait_for_settle()
         return response 
 
     def handle(self, toolUse):
         input_data = toolUse['input']
         tool_use_id = toolUse['toolUseId']
+        self.steps += 1
+        if self.screenshot.recorder is not None:
+            self.screenshot.recorder.mark(step=self.steps, toolUseId=tool_use_id, action=input_data.get('action'), command=input_data.get('command'))
         if(input_data.get('action')):
             action = input_data.get('action')
             self.logger.debug(f'action:{action}')
-            tool_result = self.execute_tool_action(action, input_data, tool_use_id)
+            with metrics.span("computer.action", action=action):
+                tool_result = self.execute_tool_action(action, input_data, tool_use_id)
             return tool_result
         elif(input_data.get('command')):
             command = input_data.get('command')
             self.logger.debug(f'command:{command}')
-            tool_result = self.execute_tool_command(command, input_data, tool_use_id)
+            with metrics.span("computer.command"):
+                tool_result = self.execute_tool_command(command, input_data, tool_use_id)
             return tool_result
         # elif(input_data.get('type')):
         #     input_data_type = input_data.get('type')
@@ -0,0 +1,61 @@
+import hashlib
+
+class BlockHash:
+    """Coarse fingerprint of a frame: the mean luminance of a grid of blocks.
+
+    Cheap enough to compute on every capture, and tolerant of the small
+    resampling noise that makes byte-for-byte comparison of frames useless.
+    """
+    COLUMNS = 64
+    ROWS = 48
+    # luminance difference below which a block counts as unchanged
+    TOLERANCE = 2
+
+    def __init__(self, blocks, columns=COLUMNS, rows=ROWS):
+        self.blocks = blocks
+        self.columns = columns
+        self.rows = rows
+
+    @classmethod
+    def from_image(cls, image, columns=COLUMNS, rows=ROWS):
+        from PIL import Image
+        small = image.resize((columns, rows), Image.Resampling.BOX).convert('L')
+        return cls(small.tobytes(), columns, rows)
+
+    @classmethod
+    def from_frame(cls, frame, columns=COLUMNS, rows=ROWS):
+        from PIL import Image
+        # RGBX wraps the BGRX buffer without a copy; the swapped channels do not matter for change detection
+        image = Image.frombuffer('RGBX', (frame.width, frame.height), frame.data, 'raw', 'RGBX', 0, 1)
+        return cls.from_image(image, columns, rows)
+
+    def changed_blocks(self, other):
+        """Indices of the blocks that differ from `other`."""
+        return [i for i, (a, b) in enumerate(zip(self.blocks, other.blocks)) if abs(a - b) > self.TOLERANCE]
+
+    def difference(self, other):
+        """Fraction of blocks that changed, 0.0 for identical frames."""
+        if other is None or (self.columns, self.rows) != (other.columns, other.rows):
+            return 1.0
+        return len(self.changed_blocks(other)) / len(self.blocks)
+
+    def dirty_rect(self, other, width, height):
+        """Bounding box (left, top, right, bottom) of the changed area in a `width` x `height` frame, or None."""
+        changed = self.changed_blocks(other)
+        if not changed:
+            return None
+        columns = [i % self.columns for i in changed]
+        rows = [i // self.columns for i in changed]
+        return (min(columns) * width // self.columns,
+                min(rows) * height // self.rows,
+                (max(columns) + 1) * width // self.columns,
+                (max(rows) + 1) * height // self.rows)
+
+    def __eq__(self, other):
+        return isinstance(other, BlockHash) and self.blocks == other.blocks
+
+    def __hash__(self):
+        return hash(self.blocks)
+
+    def hexdigest(self):
+        return hashlib.sha1(self.blocks).hexdigest()
@@ -1,13 +1,57 @@
-import boto3
-from botocore.config import Config
+import glob
+import io
+import itertools
 import os
 import logging
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from time import perf_counter
 import json
 
+from agent.metrics import metrics
+from agent.aws_clients import clients
+
+MB = 1024 * 1024
+
+def s3_etag(path, multipart_threshold, multipart_chunksize):
+    """The ETag S3 reports for `path` when uploaded with these transfer settings."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size < multipart_threshold:
+            return f'"{md5(f.read()).hexdigest()}"'
+        parts = []
+        while chunk := f.read(multipart_chunksize):
+            parts.append(md5(chunk).digest())
+    return f'"{md5(b"".join(parts)).hexdigest()}-{len(parts)}"'
+
+class JSONStream(io.RawIOBase):
+    """Read-only file object over `json.JSONEncoder.iterencode`, so an object is encoded as it is uploaded."""
+    def __init__(self, value, **kwargs):
+        self.chunks = json.JSONEncoder(**kwargs).iterencode(value)
+        self.buffer = bytearray()
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk.encode('utf-8')
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.bytes_read += len(data)
+        return data
+
 class S3Upload:
     TOOLSPECNAME_UPLOAD_FILE='s3_upload_file'
     TOOLSPECNAME_UPLOAD_MEMORY='s3_upload_object'
+    TOOLSPECNAME_UPLOAD_DIRECTORY='s3_upload_directory'
     TOOLSPEC=[{
                 "toolSpec":{
                     'name': TOOLSPECNAME_UPLOAD_FILE,
@@ -61,23 +105,52 @@ class S3Upload:
                         }
                     }
                 }
-            }            
-        ]
-    def __init__(self):
-        boto3_config = Config(
-            region_name = 'us-east-1',
-            signature_version = 'v4',
-            retries = {
-                'max_attempts': 1,
-                'mode': 'standard'
+            },
+            {
+                "toolSpec":{
+                    'name': TOOLSPECNAME_UPLOAD_DIRECTORY,
+                    "description": "Upload every file of a local directory, or every file matching a glob pattern, to AWS S3 in parallel. Files already in S3 with the same content are skipped.",
+                    'inputSchema': {
+                        'json': {
+                            'type': 'object',
+                            "properties": {
+                                "localPath": {
+                                    "type": "string",
+                                    "description": "A local directory, uploaded recursively, or a glob pattern such as /home/computeruse/exports/**/*.csv"
+                                },
+                                "bucketname": {
+                                    "type": "string",
+                                    "description": "The S3 bucket name to upload the files to"
+                                },
+                                "s3prefix": {
+                                    "type": "string",
+                                    "description": "The S3 key prefix; each file's path relative to the directory (or to the fixed part of the glob) is appended to it"
+                                },
+                                "skipUnchanged": {
+                                    "type": "boolean",
+                                    "description": "Skip files whose size and ETag already match the S3 object, default true"
+                                }
+                            },
+                            "required": ["localPath","bucketname","s3prefix"]
+                        }
+                    }
+                }
             }
+        ]
+    def __init__(self, client=None, region_name=None):
+        """`client` defaults to the shared S3 client from agent.aws_clients."""
+        # s3transfer pulls in most of boto3, only load it once a session is built
+        from boto3.s3.transfer import TransferConfig
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(os.environ.get("S3_MULTIPART_THRESHOLD_MB", 16)) * MB,
+            multipart_chunksize=int(os.environ.get("S3_MULTIPART_CHUNKSIZE_MB", 16)) * MB,
+            max_concurrency=int(os.environ.get("S3_MAX_CONCURRENCY", 8))
         )
-        session = boto3.Session(
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            aws_session_token=os.environ.get('AWS_SESSION_TOKEN')
+        # files uploaded at once by s3_upload_directory, each with up to max_concurrency parts in flight
+        self.upload_workers = int(os.environ.get("S3_UPLOAD_WORKERS", 4))
+        self.client = client or clients.client(
+            "s3", region_name, max_pool_connections=self.upload_workers * self.transfer_config.max_concurrency
         )
-        self.client = session.client("s3", config=boto3_config)
         self.logger = logging.getLogger(__name__)
         self.logger.debug("S3Upload initialized")
 
@@ -89,8 +162,9 @@ class S3Upload:
         bucketname = toolUse['input']['bucketname']
         s3key = toolUse['input']['s3key']
         try:
-            with open(localFile, 'rb') as f:
-                self.client.upload_fileobj(f,  bucketname, s3key)
+            with metrics.span("s3.upload_file") as span, open(localFile, 'rb') as f:
+                span['bytes'] = os.fstat(f.fileno()).st_size
+                self.client.upload_fileobj(f,  bucketname, s3key, Config=self.transfer_config)
 
             # response = self.client.upload_file(localFile, bucketname, s3key)
             return {
@@ -112,9 +186,14 @@ class S3Upload:
         bucketname = toolUse['input']['bucketname']
         s3key = toolUse['input']['s3key']
         try:
-            user_encode_data = json.dumps(object_data, indent=2).encode('utf-8')
+            # encoded while it is read, large objects go up in parts without a full copy in memory
+            stream = JSONStream(object_data, indent=2)
 
-            self.client.put_object(Body=user_encode_data, Bucket=bucketname, Key=s3key)
+            with metrics.span("s3.upload_object") as span:
+                try:
+                    self.client.upload_fileobj(stream, bucketname, s3key, Config=self.transfer_config)
+                finally:
+                    span['bytes'] = stream.bytes_read
             # self.client.Object(bucketname, s3key).put(Body=object_data)
 
             # response = self.client.upload_file(localFile, bucketname, s3key)
@@ -129,3 +208,93 @@ class S3Upload:
         except ClientError as e:
             logging.exception(e)
             raise e        
+
+    def list_files(self, local_path):
+        """(path, key suffix) for every file under directory `local_path`, or matching it as a glob."""
+        if os.path.isdir(local_path):
+            files = [os.path.join(root, name) for root, _, names in os.walk(local_path) for name in names]
+            base = local_path
+        else:
+            files = [path for path in glob.glob(local_path, recursive=True) if os.path.isfile(path)]
+            # keys are relative to the fixed leading directories of the pattern, whichever files matched
+            parts = local_path.split(os.sep)
+            fixed = list(itertools.takewhile(lambda part: not glob.has_magic(part), parts[:-1]))
+            # [''] is the root of an absolute pattern such as /*.csv
+            base = os.sep.join(fixed) or (os.sep if fixed else os.curdir)
+        return [(path, os.path.relpath(path, base).replace(os.sep, '/')) for path in sorted(files)]
+
+    def is_unchanged(self, path, bucketname, key, size):
+        try:
+            head = self.client.head_object(Bucket=bucketname, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            if e.response['Error']['Code'] in ('403', 'AccessDenied', 'Forbidden'):
+                # a missing key also answers 403 without s3:ListBucket; the upload may still be allowed
+                self.logger.debug(f"cannot check s3://{bucketname}/{key}, uploading it: {e}")
+                return False
+            raise
+        if head['ContentLength'] != size:
+            return False
+        return head['ETag'] == s3_etag(path, self.transfer_config.multipart_threshold, self.transfer_config.multipart_chunksize)
+
+    def _upload_one(self, path, bucketname, key, skip_unchanged):
+        size = os.path.getsize(path)
+        start = perf_counter()
+        try:
+            if skip_unchanged and self.is_unchanged(path, bucketname, key, size):
+                return {'file': path, 'key': key, 'bytes': size, 'status': 'skipped'}
+            with metrics.span("s3.upload_file") as span:
+                span['bytes'] = size
+                self.client.upload_file(path, bucketname, key, Config=self.transfer_config)
+        except (ClientError, OSError) as e:
+            self.logger.exception(f"upload of {path} to s3://{bucketname}/{key} failed")
+            return {'file': path, 'key': key, 'bytes': size, 'status': 'error', 'error': str(e)}
+        seconds = perf_counter() - start
+        return {'file': path, 'key': key, 'bytes': size, 'status': 'uploaded', 'seconds': seconds}
+
+    def upload_directory(self, toolUse):
+        self.logger.debug(f"toolUse: {toolUse}")
+        tool_use_id = toolUse['toolUseId']
+        local_path = toolUse['input']['localPath']
+        bucketname = toolUse['input']['bucketname']
+        prefix = toolUse['input'].get('s3prefix', '')
+        skip_unchanged = toolUse['input'].get('skipUnchanged', True)
+        files = self.list_files(local_path)
+        if not files:
+            return {
+                'toolResult': {
+                    'toolUseId': tool_use_id,
+                    'content':[{'text': f'No files found at {local_path}'}],
+                    'status': 'error'
+                }
+            }
+        start = perf_counter()
+        with metrics.span("s3.upload_directory") as span, ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="s3-upload") as pool:
+            results = list(pool.map(
+                lambda file: self._upload_one(file[0], bucketname, f"{prefix.rstrip('/')}/{file[1]}" if prefix else file[1], skip_unchanged),
+                files
+            ))
+            span['files'] = len(results)
+        seconds = perf_counter() - start
+
+        lines = []
+        for result in results:
+            target = f"s3://{bucketname}/{result['key']}"
+            if result['status'] == 'uploaded':
+                lines.append(f"uploaded {result['file']} -> {target}: {result['bytes']} bytes in {result['seconds']:.2f}s ({result['bytes'] / MB / max(result['seconds'], 1e-6):.1f} MB/s)")
+            elif result['status'] == 'skipped':
+                lines.append(f"skipped {result['file']} -> {target}: unchanged, {result['bytes']} bytes")
+            else:
+                lines.append(f"failed {result['file']} -> {target}: {result['error']}")
+        uploaded = sum(result['bytes'] for result in results if result['status'] == 'uploaded')
+        counts = {status: sum(1 for result in results if result['status'] == status) for status in ('uploaded', 'skipped', 'error')}
+        lines.append(f"{counts['uploaded']} uploaded, {counts['skipped']} skipped, {counts['error']} failed; "
+                     f"{uploaded} bytes in {seconds:.2f}s ({uploaded / MB / max(seconds, 1e-6):.1f} MB/s)")
+        return {
+            'toolResult': {
+                'toolUseId': tool_use_id,
+                'content':[{'text': '\n'.join(lines)}],
+                'status': 'error' if counts['error'] else 'success'
+            }
+        }
@@ -0,0 +1,44 @@
+import logging
+import os
+from time import monotonic, sleep
+
+class ScreenSettle:
+    """Wait until the screen stops changing after an action.
+
+    `sample` returns a (BlockHash, frame) pair. The screen counts as settled
+    once consecutive samples have matched for `stable_ms`; after `timeout_ms`
+    the latest sample is returned regardless.
+
+    With `single`, for samplers too slow to poll such as pyautogui's
+    screenshot tools, it waits `delay_ms` and samples once instead, taking
+    that frame as settled.
+    """
+    def __init__(self, sample, stable_ms=None, timeout_ms=None, poll_ms=None, single=False, delay_ms=None):
+        self.sample = sample
+        self.single = single
+        self.delay = (delay_ms if delay_ms is not None else int(os.environ.get("SCREEN_SETTLE_SINGLE_DELAY_MS", 250))) / 1000
+        self.stable = (stable_ms if stable_ms is not None else int(os.environ.get("SCREEN_SETTLE_STABLE_MS", 150))) / 1000
+        self.timeout = (timeout_ms if timeout_ms is not None else int(os.environ.get("SCREEN_SETTLE_TIMEOUT_MS", 3000))) / 1000
+        self.poll = (poll_ms if poll_ms is not None else int(os.environ.get("SCREEN_SETTLE_POLL_MS", 50))) / 1000
+        self.logger = logging.getLogger(__name__)
+
+    def wait(self):
+        """Return (frame_hash, frame, settled) for the last frame sampled."""
+        if self.single:
+            sleep(self.delay)
+            frame_hash, frame = self.sample()
+            return frame_hash, frame, True
+        start = monotonic()
+        stable_hash, stable_since = None, start
+        while True:
+            frame_hash, frame = self.sample()
+            now = monotonic()
+            if stable_hash is None or frame_hash.difference(stable_hash) > 0:
+                stable_hash, stable_since = frame_hash, now
+            elif now - stable_since >= self.stable:
+                self.logger.debug(f"screen settled after {(now - start) * 1000:.0f} ms")
+                return frame_hash, frame, True
+            if now - start >= self.timeout:
+                self.logger.debug(f"screen still changing after {self.timeout * 1000:.0f} ms")
+                return frame_hash, frame, False
+            sleep(self.poll)
@@ -0,0 +1,56 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+class ScreenshotWriter:
+    """Write already-encoded screenshots to disk on a background thread.
+
+    The queue is bounded, so when the disk falls behind `submit` blocks the
+    caller instead of buffering an unbounded number of frames in memory.
+    Pending writes are flushed on `close`, which is also registered with atexit.
+    """
+    def __init__(self, max_pending=None):
+        if max_pending is None:
+            max_pending = int(os.environ.get("SCREENSHOT_WRITER_QUEUE_SIZE", 8))
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="screenshot-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, filename, data):
+        if self.closed:
+            raise RuntimeError("ScreenshotWriter is closed")
+        try:
+            self.queue.put_nowait((filename, data))
+        except queue.Full:
+            self.logger.debug(f"screenshot writer queue full ({self.queue.maxsize}), waiting for disk")
+            self.queue.put((filename, data))
+
+    def flush(self):
+        """Block until every submitted screenshot has been written."""
+        self.queue.join()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                filename, data = item
+                with open(filename, 'wb') as f:
+                    f.write(data)
+            except OSError as e:
+                self.logger.error(f"failed to write screenshot {item[0]}: {e}")
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,248 @@
+import logging
+import os
+import selectors
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import namedtuple
+from time import monotonic
+
+class HeadTailBuffer:
+    """Keep the first and last `limit // 2` bytes of a stream and count what was dropped in between."""
+    def __init__(self, limit):
+        self.half = max(1, limit // 2)
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    def write(self, data):
+        room = self.half - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        self.tail += data
+        if len(self.tail) > 2 * self.half:
+            excess = len(self.tail) - self.half
+            self.dropped += excess
+            del self.tail[:excess]
+
+    def getvalue(self):
+        tail = self.tail[-self.half:] if len(self.tail) > self.half else self.tail
+        dropped = self.dropped + len(self.tail) - len(tail)
+        if not dropped:
+            return (self.head + tail).decode('utf-8', errors='replace')
+        return (self.head.decode('utf-8', errors='replace')
+                + f"\n... [{dropped} bytes of output truncated] ...\n"
+                + tail.decode('utf-8', errors='replace'))
+
+ProcessInfo = namedtuple('ProcessInfo', 'pid ppid pgid session starttime')
+
+def list_processes():
+    """ProcessInfo of every process that can be read from /proc."""
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the command name may contain spaces and parentheses, the fields after it do not
+        fields = stat[stat.rindex(')') + 2:].split()
+        yield ProcessInfo(int(entry), int(fields[1]), int(fields[2]), int(fields[3]), int(fields[19]))
+
+class ShellSession:
+    """A long-lived bash process, so cwd and environment persist between commands.
+
+    The shell runs with job control (`set -m`), so every job, foreground or
+    background, has its own process group. Each command is written to a file
+    and sourced by the shell itself, so an incomplete command fails at once
+    with a syntax error. It runs with stdin from /dev/null, and its stdout
+    and stderr go to a FIFO of its own. Background jobs inherit that FIFO; once the command is done
+    it is drained and discarded, so their later output cannot leak into the
+    next result. The shell's stdout only carries a sentinel line with the
+    exit status. Output is kept in a HeadTailBuffer of `max_output` bytes.
+
+    A command still running after `timeout` seconds has its foreground job
+    killed, leaving background jobs such as GUI applications alone. The
+    shell is only restarted if it does not come back after that.
+    """
+    def __init__(self, env=None, timeout=None, max_output=None):
+        self.env = env
+        self.timeout = timeout if timeout is not None else float(os.environ.get("SHELL_COMMAND_TIMEOUT", 120))
+        self.max_output = max_output if max_output is not None else int(os.environ.get("SHELL_MAX_OUTPUT_BYTES", 64 * 1024))
+        self.process = None
+        self.folder = tempfile.mkdtemp(prefix="shell-session-")
+        # sessions of every shell started, background jobs outlive a restarted shell
+        self.session_ids = set()
+        # whether the last command that timed out took the shell down with it
+        self.restarted = False
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=self.env,
+            start_new_session=True
+        )
+        self.session_ids.add(self.process.pid)
+        self.process.stdin.write(b"set -m\n")
+        self.process.stdin.flush()
+        self.control = b''
+        self.logger.debug(f"started shell pid {self.process.pid}")
+
+    def children(self):
+        return [process for process in list_processes() if process.ppid == self.process.pid]
+
+    @staticmethod
+    def descendants(pid):
+        """`pid` and every process below it."""
+        processes = list(list_processes())
+        found = [pid]
+        for parent in found:
+            found.extend(process.pid for process in processes if process.ppid == parent)
+        return found
+
+    def run(self, command, timeout=None):
+        """Run `command` and return (output, exit_code, timed_out); exit_code is None on timeout."""
+        timeout = timeout if timeout is not None else self.timeout
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            # the shell is idle, so any children are background jobs of earlier commands
+            background = {process.pid for process in self.children()}
+            path = os.path.join(self.folder, uuid.uuid4().hex)
+            os.mkfifo(path)
+            reader = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            # held until the command is done, so the FIFO does not read as closed before bash opens it
+            writer = os.open(path, os.O_WRONLY)
+            # sourced from a file, so an incomplete command is a syntax error rather than bash waiting for more input
+            source = f"{path}.sh"
+            with open(source, 'w') as f:
+                f.write(command + "\n")
+            sentinel = f"__CMD_DONE_{uuid.uuid4().hex}__"
+            script = f"{{ . '{source}'\n}} < /dev/null > '{path}' 2>&1\nprintf '\\n%s %s\\n' '{sentinel}' \"$?\"\n"
+            output = HeadTailBuffer(self.max_output)
+            self.restarted = False
+            try:
+                self.process.stdin.write(script.encode())
+                self.process.stdin.flush()
+                state, exit_code = self._wait(sentinel, reader, output, monotonic() + timeout)
+                timed_out = state == 'timeout'
+                if timed_out:
+                    state, exit_code = self._interrupt(background, sentinel, reader, output)
+            finally:
+                os.close(writer)
+                os.unlink(path)
+                os.unlink(source)
+                self._finish(reader, output)
+            if state == 'exited':
+                # the shell itself exited, e.g. the command ran `exit`
+                exit_code = self.process.wait()
+                self.process = None
+            return output.getvalue(), None if timed_out else exit_code, timed_out
+
+    def _wait(self, sentinel, reader, output, deadline):
+        """Collect output until the sentinel; returns ('done', exit code), ('exited', None) or ('timeout', None)."""
+        marker = f"{sentinel} ".encode()
+        stdout = self.process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout, selectors.EVENT_READ)
+            selector.register(reader, selectors.EVENT_READ)
+            while True:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return 'timeout', None
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if key.fd == reader:
+                        output.write(chunk)
+                        continue
+                    if not chunk:
+                        return 'exited', None
+                    self.control += chunk
+                    index = self.control.find(marker)
+                    end = self.control.find(b"\n", index + len(marker)) if index >= 0 else -1
+                    if end >= 0:
+                        exit_code = int(self.control[index + len(marker):end])
+                        self.control = self.control[end + 1:]
+                        return 'done', exit_code
+                    # anything else on the shell's stdout is its own chatter, such as job notices
+                    self.control = self.control[-(len(marker) + 16):]
+
+    def _interrupt(self, background, sentinel, reader, output):
+        """Kill the foreground job of a timed out command; restart the shell if it does not come back."""
+        for _ in range(5):
+            # while bash waits for its foreground job it starts nothing else, so that job is the newest child
+            jobs = [process for process in self.children() if process.pid not in background]
+            if not jobs:
+                break
+            job = max(jobs, key=lambda process: process.starttime)
+            try:
+                if job.pgid == self.process.pid:
+                    # e.g. a command substitution, run in the shell's own group
+                    for pid in self.descendants(job.pid):
+                        os.kill(pid, signal.SIGKILL)
+                else:
+                    os.killpg(job.pgid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            state, exit_code = self._wait(sentinel, reader, output, monotonic() + 1)
+            if state != 'timeout':
+                self.logger.debug(f"killed foreground job {job.pgid}, shell is back")
+                return state, exit_code
+        self.logger.warning(f"shell pid {self.process.pid} did not return from a timed out command, restarting it")
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self.process = None
+        self.restarted = True
+        return 'restarted', None
+
+    def _finish(self, reader, output):
+        """Take what the command wrote before it ended, then discard whatever background jobs write later."""
+        while True:
+            try:
+                chunk = os.read(reader, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                os.close(reader)
+                return
+            output.write(chunk)
+        threading.Thread(target=self._discard, args=(reader,), name="shell-discard", daemon=True).start()
+
+    @staticmethod
+    def _discard(reader):
+        os.set_blocking(reader, True)
+        # until every background job holding the FIFO has closed it
+        while os.read(reader, 65536):
+            pass
+        os.close(reader)
+
+    def kill(self):
+        """Kill the shell and every job it started, background jobs included."""
+        for process in list_processes():
+            if process.session in self.session_ids:
+                try:
+                    os.kill(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        if self.process is not None:
+            self.process.wait()
+        self.process = None
+        self.session_ids = set()
+
+    def close(self):
+        with self.lock:
+            self.kill()
+            shutil.rmtree(self.folder, ignore_errors=True)
@@ -0,0 +1,142 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from time import monotonic, strftime
+
+from .x11_capture import Frame
+
+class VideoRecorder:
+    """Pipe captured frames into one long-running ffmpeg process.
+
+    Frames are raw BGRX straight from the capture path and are encoded with
+    their wall-clock timestamps, so only frames that differ need to be sent.
+    A sidecar `<video>.index.jsonl` maps each tool call to the first frame
+    recorded after it and its time in the video. Encoding happens on a
+    background thread behind a queue of `max_pending` frames; when ffmpeg
+    falls behind, frames are dropped rather than slowing the agent down.
+    """
+    CODECS = {
+        # fragmented mp4 stays playable if the process dies before the file is closed
+        'h264': (['-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'stillimage', '-crf', '30',
+                  '-pix_fmt', 'yuv420p', '-movflags', '+frag_keyframe+empty_moov'], 'mp4'),
+        'vp9': (['-c:v', 'libvpx-vp9', '-deadline', 'realtime', '-cpu-used', '8', '-crf', '40', '-b:v', '0',
+                 '-pix_fmt', 'yuv420p'], 'webm'),
+    }
+
+    def __init__(self, folder, codec=None, max_pending=None):
+        self.codec = codec or os.environ.get("SESSION_VIDEO_CODEC", "h264")
+        if self.codec not in self.CODECS:
+            raise ValueError(f"unsupported SESSION_VIDEO_CODEC {self.codec}, expected one of {', '.join(self.CODECS)}")
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("ffmpeg not found")
+        self.path = f"{folder}/session_{strftime('%Y%m%d-%H%M%S')}.{self.CODECS[self.codec][1]}"
+        self.index_path = f"{self.path}.index.jsonl"
+        self.queue = queue.Queue(maxsize=max_pending if max_pending is not None else int(os.environ.get("SESSION_VIDEO_QUEUE_SIZE", 4)))
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.process = None
+        self.thread = None
+        self.index = None
+        # marks made before the first frame, written with it
+        self.pending_marks = []
+        self.size = None
+        self.start = None
+        self.frames = 0
+        self.dropped = 0
+        self.closed = False
+        atexit.register(self.close)
+
+    def command(self, width, height):
+        options, _ = self.CODECS[self.codec]
+        return ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+                '-f', 'rawvideo', '-pix_fmt', 'bgr0', '-s', f'{width}x{height}',
+                '-use_wallclock_as_timestamps', '1', '-i', '-',
+                '-vsync', 'vfr', *options, self.path]
+
+    def _start(self, width, height):
+        self.size = (width, height)
+        self.process = subprocess.Popen(self.command(width, height), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        self.index = open(self.index_path, 'a')
+        self.start = monotonic()
+        for fields in self.pending_marks:
+            self._write_mark(fields)
+        self.pending_marks = []
+        self.thread = threading.Thread(target=self._run, args=(self.process,), name="video-recorder", daemon=True)
+        self.thread.start()
+        self.logger.info(f"recording session video to {self.path}")
+
+    def add_frame(self, frame):
+        """Queue a capture.Frame or PIL image; the bytes are copied, so the capture buffer may be reused."""
+        if isinstance(frame, Frame):
+            width, height, data = frame.width, frame.height, bytes(frame.data)
+        else:
+            width, height = frame.size
+            data = frame.tobytes('raw', 'BGRX')
+        with self.lock:
+            if self.closed:
+                return
+            if self.process is None:
+                self._start(width, height)
+            elif (width, height) != self.size:
+                self.logger.warning(f"dropping {width}x{height} frame, video is {self.size[0]}x{self.size[1]}")
+                return
+            try:
+                self.queue.put_nowait(data)
+                self.frames += 1
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    self.logger.warning(f"video encoder falling behind, {self.dropped} frames dropped")
+
+    def mark(self, **fields):
+        """Add an index line pointing at the next frame, e.g. mark(step=3, action='left_click')."""
+        with self.lock:
+            if self.closed:
+                return
+            if self.index is None:
+                self.pending_marks.append(fields)
+                return
+            self._write_mark(fields)
+
+    def _write_mark(self, fields):
+        self.index.write(json.dumps({
+            **fields,
+            'frame': self.frames,
+            't': round(monotonic() - self.start, 3)
+        }, default=str) + '\n')
+        self.index.flush()
+
+    def _run(self, process):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                return
+            try:
+                process.stdin.write(data)
+            except (BrokenPipeError, ValueError) as e:
+                self.logger.error(f"ffmpeg stopped accepting frames, video recording ends: {e}")
+                with self.lock:
+                    self.closed = True
+                return
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.process is None:
+                return
+            process, self.process = self.process, None
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+        self.index.close()
+        self.logger.info(f"session video {self.path}: {self.frames} frames, {self.dropped} dropped")
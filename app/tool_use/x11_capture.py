@@ -0,0 +1,214 @@
+import ctypes
+import ctypes.util
+import logging
+
+from Xlib import X
+from Xlib.error import CatchError
+from Xlib.protocol import rq
+
+# MIT-SHM requests, defined against python-xlib's protocol layer so they go
+# over the same connection pyautogui already uses.
+# https://www.x.org/releases/X11R7.7/doc/xextproto/shm.html
+SHM_EXTNAME = 'MIT-SHM'
+
+class ShmQueryVersion(rq.ReplyRequest):
+    _request = rq.Struct(rq.Card8('opcode'),
+                         rq.Opcode(0),
+                         rq.RequestLength(),
+                         )
+
+    _reply = rq.Struct(rq.ReplyCode(),
+                       rq.Bool('shared_pixmaps'),
+                       rq.Card16('sequence_number'),
+                       rq.ReplyLength(),
+                       rq.Card16('major_version'),
+                       rq.Card16('minor_version'),
+                       rq.Card16('uid'),
+                       rq.Card16('gid'),
+                       rq.Card8('pixmap_format'),
+                       rq.Pad(15),
+                       )
+
+class ShmAttach(rq.Request):
+    _request = rq.Struct(rq.Card8('opcode'),
+                         rq.Opcode(1),
+                         rq.RequestLength(),
+                         rq.Card32('shmseg'),
+                         rq.Card32('shmid'),
+                         rq.Bool('read_only'),
+                         rq.Pad(3),
+                         )
+
+class ShmDetach(rq.Request):
+    _request = rq.Struct(rq.Card8('opcode'),
+                         rq.Opcode(2),
+                         rq.RequestLength(),
+                         rq.Card32('shmseg'),
+                         )
+
+class ShmGetImage(rq.ReplyRequest):
+    _request = rq.Struct(rq.Card8('opcode'),
+                         rq.Opcode(4),
+                         rq.RequestLength(),
+                         rq.Drawable('drawable'),
+                         rq.Int16('x'),
+                         rq.Int16('y'),
+                         rq.Card16('width'),
+                         rq.Card16('height'),
+                         rq.Card32('plane_mask'),
+                         rq.Card8('format'),
+                         rq.Pad(3),
+                         rq.Card32('shmseg'),
+                         rq.Card32('offset'),
+                         )
+
+    _reply = rq.Struct(rq.ReplyCode(),
+                       rq.Card8('depth'),
+                       rq.Card16('sequence_number'),
+                       rq.ReplyLength(),
+                       rq.Card32('visual'),
+                       rq.Card32('size'),
+                       rq.Pad(16),
+                       )
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+class _SharedMemory:
+    """A SysV shared memory segment mapped into this process."""
+    def __init__(self, size):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmget.restype = ctypes.c_int
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+        self.libc = libc
+        self.size = size
+        self.shmid = libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if self.shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        self.address = libc.shmat(self.shmid, None, 0)
+        if self.address in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(self.shmid, IPC_RMID, None)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self.buffer = memoryview((ctypes.c_char * size).from_address(self.address)).cast('B')
+
+    def mark_for_removal(self):
+        # the segment lives on until both we and the X server have detached
+        self.libc.shmctl(self.shmid, IPC_RMID, None)
+
+    def close(self):
+        if self.address is not None:
+            self.buffer.release()
+            self.libc.shmdt(self.address)
+            self.address = None
+
+class Frame:
+    """A captured screen in 32 bits per pixel BGRX layout.
+
+    `data` is a view into the grabber's reusable buffer and is overwritten by
+    the next capture, so encode or copy it before capturing again.
+    """
+    def __init__(self, width, height, data):
+        self.width = width
+        self.height = height
+        self.data = data
+
+    def to_image(self):
+        from PIL import Image
+        return Image.frombuffer('RGB', (self.width, self.height), self.data, 'raw', 'BGRX', 0, 1)
+
+class X11Capture:
+    """Grab the root window directly over an Xlib connection.
+
+    Uses the MIT-SHM extension when the server offers it and the segment can
+    be attached (same host and IPC namespace), otherwise falls back to the core
+    GetImage request copied into a preallocated buffer.
+    """
+    def __init__(self, display, use_shm=True):
+        self.logger = logging.getLogger(__name__)
+        self.display = display
+        screen = display.screen()
+        self.root = screen.root
+        self.width = screen.width_in_pixels
+        self.height = screen.height_in_pixels
+        depth = screen.root_depth
+        bits_per_pixel = next((f.bits_per_pixel for f in display.display.info.pixmap_formats if f.depth == depth), None)
+        if bits_per_pixel != 32:
+            raise ValueError(f"unsupported root window format: depth {depth}, {bits_per_pixel} bits per pixel")
+        self.size = self.width * self.height * 4
+        self.shm = None
+        self.shmseg = None
+        self.shm_opcode = None
+        if use_shm:
+            self._attach_shm()
+        if self.shm is None:
+            self.buffer = memoryview(bytearray(self.size))
+        else:
+            self.buffer = self.shm.buffer
+        self.logger.debug(f"X11Capture {self.width}x{self.height} using {self.backend}")
+
+    @property
+    def backend(self):
+        return 'xshm' if self.shm is not None else 'getimage'
+
+    def _attach_shm(self):
+        extension = self.display.query_extension(SHM_EXTNAME)
+        if extension is None:
+            self.logger.debug("MIT-SHM not available, using GetImage")
+            return
+        self.shm_opcode = extension.major_opcode
+        try:
+            ShmQueryVersion(display=self.display.display, opcode=self.shm_opcode)
+            shm = _SharedMemory(self.size)
+        except Exception as e:
+            self.logger.debug(f"MIT-SHM setup failed, using GetImage: {e}")
+            return
+        shmseg = self.display.display.allocate_resource_id()
+        catcher = CatchError()
+        ShmAttach(display=self.display.display,
+                  onerror=catcher,
+                  opcode=self.shm_opcode,
+                  shmseg=shmseg,
+                  shmid=shm.shmid,
+                  read_only=False)
+        self.display.sync()
+        shm.mark_for_removal()
+        if catcher.get_error():
+            # typically BadAccess when the server is on another host
+            self.logger.debug(f"MIT-SHM attach refused, using GetImage: {catcher.get_error()}")
+            self.display.display.free_resource_id(shmseg)
+            shm.close()
+            return
+        self.shm = shm
+        self.shmseg = shmseg
+
+    def capture(self):
+        """Capture the full root window into the reusable buffer and return it as a Frame."""
+        if self.shm is not None:
+            ShmGetImage(display=self.display.display,
+                        opcode=self.shm_opcode,
+                        drawable=self.root,
+                        x=0,
+                        y=0,
+                        width=self.width,
+                        height=self.height,
+                        plane_mask=0xffffffff,
+                        format=X.ZPixmap,
+                        shmseg=self.shmseg,
+                        offset=0)
+        else:
+            reply = self.root.get_image(0, 0, self.width, self.height, X.ZPixmap, 0xffffffff)
+            self.buffer[:] = reply.data
+        return Frame(self.width, self.height, self.buffer)
+
+    def close(self):
+        if self.shm is not None:
+            ShmDetach(display=self.display.display, opcode=self.shm_opcode, shmseg=self.shmseg)
+            self.display.sync()
+            self.display.display.free_resource_id(self.shmseg)
+            self.shm.close()
+            self.shm = None
@@ -0,0 +1,276 @@
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from time import sleep
+
+import pyperclip
+from Xlib import X, XK
+from Xlib.ext import xtest
+from Xlib.xobject.drawable import Window
+
+XK.load_keysym_group('xf86')
+
+# xdotool / pyautogui style names that are not X keysym names
+KEY_ALIASES = {
+    'ctrl': 'Control_L',
+    'control': 'Control_L',
+    'shift': 'Shift_L',
+    'alt': 'Alt_L',
+    'option': 'Alt_L',
+    'super': 'Super_L',
+    'win': 'Super_L',
+    'cmd': 'Super_L',
+    'command': 'Super_L',
+    'meta': 'Meta_L',
+    'return': 'Return',
+    'enter': 'Return',
+    'esc': 'Escape',
+    'backspace': 'BackSpace',
+    'del': 'Delete',
+    'ins': 'Insert',
+    'pageup': 'Prior',
+    'pgup': 'Prior',
+    'pagedown': 'Next',
+    'pgdn': 'Next',
+    'printscreen': 'Print',
+    'capslock': 'Caps_Lock',
+    'numlock': 'Num_Lock',
+}
+
+# keysym names in any case, e.g. "page_down" or "f5"; python-xlib spells
+# XF86AudioMute as XF86_AudioMute
+KEYSYM_NAMES = {}
+for _name in dir(XK):
+    if _name.startswith('XK_'):
+        KEYSYM_NAMES.setdefault(_name[3:].lower(), getattr(XK, _name))
+        KEYSYM_NAMES.setdefault(_name[3:].lower().replace('xf86_', 'xf86'), getattr(XK, _name))
+
+CHAR_KEYSYMS = {'\n': XK.XK_Return, '\t': XK.XK_Tab, '\b': XK.XK_BackSpace}
+
+BUTTONS = {'left': 1, 'middle': 2, 'right': 3}
+
+# WM_CLASS names of terminals, which do not paste the clipboard on ctrl+v
+TERMINAL_CLASSES = {'xterm', 'uxterm', 'rxvt', 'urxvt', 'gnome-terminal', 'gnome-terminal-server', 'konsole',
+                    'xfce4-terminal', 'lxterminal', 'terminator', 'tilix', 'alacritty', 'kitty', 'st', 'st-256color'}
+
+# pyperclip talks to $DISPLAY through xclip/xsel, so the variable is swapped per call
+_clipboard_lock = threading.Lock()
+
+def char_to_keysym(char):
+    if char in CHAR_KEYSYMS:
+        return CHAR_KEYSYMS[char]
+    code = ord(char)
+    if 0x20 <= code <= 0x7e or 0xa0 <= code <= 0xff:
+        return code
+    return 0x01000000 | code
+
+def name_to_keysym(name):
+    if name.lower() in KEY_ALIASES:
+        name = KEY_ALIASES[name.lower()]
+    if len(name) == 1:
+        return char_to_keysym(name)
+    keysym = XK.string_to_keysym(name) or KEYSYM_NAMES.get(name.lower())
+    if not keysym:
+        raise ValueError(f"Unknown key: {name}")
+    return keysym
+
+def parse_keys(keys):
+    """Parse an xdotool style key sequence into a list of combos, each a list of keysyms.
+
+        parse_keys("ctrl+shift+t")   # one combo of three keys
+        parse_keys("ctrl+a Delete")  # two combos, pressed one after the other
+        parse_keys("ctrl++")         # ctrl and plus
+    """
+    combos = []
+    for combo in keys.split():
+        combos.append([name_to_keysym(name) for name in re.split(r'\+(?!$)', combo)])
+    if not combos:
+        raise ValueError(f"No keys in: {keys!r}")
+    return combos
+
+class X11Input:
+    """Send keyboard and pointer input with XTest over an existing Xlib connection.
+
+    Every instance drives its own connection, so sessions on different
+    displays do not share any state or lock.
+
+    Keysyms are resolved through a table built once from the server's keyboard
+    mapping; characters the layout cannot produce are bound to spare keycodes
+    on demand, as xdotool does. Text of `paste_threshold` characters or more
+    (0, the default, never pastes) is put on the clipboard and pasted with
+    `paste_keys` instead of typed, unless the focused window is a terminal.
+    The previous clipboard text is put back afterwards.
+    """
+    # seconds the pasted text stays on the clipboard
+    PASTE_RESTORE_DELAY = 0.5
+
+    def __init__(self, display, display_name=None, paste_threshold=None, paste_keys=None):
+        self.logger = logging.getLogger(__name__)
+        self.display = display
+        self.display_name = display_name
+        self.paste_threshold = paste_threshold if paste_threshold is not None else int(os.environ.get("TYPE_PASTE_THRESHOLD", 0))
+        self.paste_keys = paste_keys if paste_keys is not None else os.environ.get("TYPE_PASTE_KEYS", "ctrl+v")
+        if not display.has_extension('XTEST'):
+            raise RuntimeError("XTEST extension not available")
+        self.shift_keycode = None
+        self._load_keymap()
+        self.shift_keycode = self.keycode(XK.XK_Shift_L)[0]
+
+    def _load_keymap(self):
+        first = self.display.display.info.min_keycode
+        count = self.display.display.info.max_keycode - first + 1
+        self.keymap = {}
+        self.spare = []
+        for offset, keysyms in enumerate(self.display.get_keyboard_mapping(first, count)):
+            keycode = first + offset
+            if not any(keysyms):
+                self.spare.append(keycode)
+                continue
+            # only the unshifted and shifted levels, other groups need modifiers XTest cannot imply
+            for index, keysym in enumerate(keysyms[:2]):
+                if keysym and keysym not in self.keymap:
+                    self.keymap[keysym] = (keycode, index)
+        # spare keycode -> keysym it is currently bound to
+        self.remapped = {}
+        self.logger.debug(f"keymap of {len(self.keymap)} keysyms, {len(self.spare)} spare keycodes")
+
+    def keycode(self, keysym):
+        """(keycode, needs_shift) for `keysym`, binding a spare keycode if the layout has none."""
+        if keysym in self.keymap:
+            keycode, index = self.keymap[keysym]
+            return keycode, index == 1
+        if not self.spare:
+            raise ValueError(f"No keycode available for keysym {keysym:#x}")
+        # reuse spare keycodes round robin
+        keycode = self.spare.pop(0)
+        self.spare.append(keycode)
+        previous = self.remapped.pop(keycode, None)
+        if previous is not None:
+            del self.keymap[previous]
+        self.display.change_keyboard_mapping(keycode, [(keysym, keysym)])
+        # clients must see the new mapping before the key event
+        self.display.sync()
+        self.remapped[keycode] = keysym
+        self.keymap[keysym] = (keycode, 0)
+        return keycode, False
+
+    def _tap(self, keycode, shift):
+        if shift:
+            xtest.fake_input(self.display, X.KeyPress, self.shift_keycode)
+        xtest.fake_input(self.display, X.KeyPress, keycode)
+        xtest.fake_input(self.display, X.KeyRelease, keycode)
+        if shift:
+            xtest.fake_input(self.display, X.KeyRelease, self.shift_keycode)
+
+    def press(self, combo):
+        """Hold the keys of `combo` (a list of keysyms) in order and release them in reverse."""
+        keycodes = [self.keycode(keysym) for keysym in combo]
+        *modifiers, (keycode, shift) = keycodes
+        held = [modifier for modifier, _ in modifiers]
+        if shift and self.shift_keycode not in held:
+            held.append(self.shift_keycode)
+        for modifier in held:
+            xtest.fake_input(self.display, X.KeyPress, modifier)
+        xtest.fake_input(self.display, X.KeyPress, keycode)
+        xtest.fake_input(self.display, X.KeyRelease, keycode)
+        for modifier in reversed(held):
+            xtest.fake_input(self.display, X.KeyRelease, modifier)
+
+    def key(self, keys):
+        """Press an xdotool style key sequence such as "Return", "ctrl+s" or "ctrl+a BackSpace"."""
+        for combo in parse_keys(keys):
+            self.press(combo)
+        self.display.sync()
+
+    def type(self, text):
+        text = text.replace('\r\n', '\n')
+        if self.paste_threshold and len(text) >= self.paste_threshold and not self.focused_terminal() and self.paste(text):
+            return
+        for i, char in enumerate(text):
+            keycode, shift = self.keycode(char_to_keysym(char))
+            self._tap(keycode, shift)
+            if i % 100 == 99:
+                # keep the server from queueing the whole text before clients catch up
+                self.display.sync()
+        self.display.sync()
+
+    def focused_terminal(self):
+        """Whether the window with the input focus, or the top-level window holding it, is a terminal."""
+        window = self.display.get_input_focus().focus
+        root = self.display.screen().root
+        while isinstance(window, Window) and window != root:
+            wm_class = window.get_wm_class()
+            if wm_class:
+                return any(name.lower() in TERMINAL_CLASSES for name in wm_class)
+            window = window.query_tree().parent
+        return False
+
+    @contextmanager
+    def _clipboard(self):
+        # pyperclip runs xclip/xsel against $DISPLAY
+        with _clipboard_lock:
+            saved = os.environ.get('DISPLAY')
+            if self.display_name:
+                os.environ['DISPLAY'] = self.display_name
+            try:
+                yield
+            finally:
+                if saved is None:
+                    os.environ.pop('DISPLAY', None)
+                else:
+                    os.environ['DISPLAY'] = saved
+
+    def paste(self, text):
+        """Paste `text` through the clipboard, then restore its text; False if no clipboard tool is available."""
+        with self._clipboard():
+            try:
+                previous = pyperclip.paste()
+                pyperclip.copy(text)
+            except pyperclip.PyperclipException as e:
+                self.logger.warning(f"clipboard unavailable, typing instead: {e}")
+                self.paste_threshold = 0
+                return False
+            self.key(self.paste_keys)
+            # the application asks for the selection after it handles the keys
+            sleep(self.PASTE_RESTORE_DELAY)
+            try:
+                pyperclip.copy(previous)
+            except pyperclip.PyperclipException as e:
+                self.logger.warning(f"could not restore the clipboard: {e}")
+        return True
+
+    def move(self, x, y):
+        xtest.fake_input(self.display, X.MotionNotify, x=x, y=y)
+        self.display.sync()
+
+    def click(self, button='left', clicks=1):
+        detail = BUTTONS[button]
+        for _ in range(clicks):
+            xtest.fake_input(self.display, X.ButtonPress, detail)
+            xtest.fake_input(self.display, X.ButtonRelease, detail)
+        self.display.sync()
+
+    def drag(self, x, y, button='left', steps=10):
+        """Press `button` where the pointer is, move to (x, y) in `steps` motion events and release."""
+        pointer = self.display.screen().root.query_pointer()
+        start_x, start_y = pointer.root_x, pointer.root_y
+        detail = BUTTONS[button]
+        xtest.fake_input(self.display, X.ButtonPress, detail)
+        self.display.sync()
+        # intermediate motion, applications start a drag on movement with the button held
+        for step in range(1, steps + 1):
+            xtest.fake_input(self.display, X.MotionNotify,
+                             x=round(start_x + (x - start_x) * step / steps),
+                             y=round(start_y + (y - start_y) * step / steps))
+        self.display.sync()
+        xtest.fake_input(self.display, X.ButtonRelease, detail)
+        self.display.sync()
+
+    def close(self):
+        """Unbind the spare keycodes that were remapped."""
+        for keycode in self.remapped:
+            self.display.change_keyboard_mapping(keycode, [(X.NoSymbol, X.NoSymbol)])
+        self.remapped = {}
+        self.display.sync()
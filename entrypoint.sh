@@ -3,10 +3,28 @@ set -e
 
 export DISPLAY=:${DISPLAY_NUM}
 
+# wait until Xvfb listens on its socket, or give up after DISPLAY_WAIT_SECONDS
+wait_for_x() {
+    for _ in $(seq 1 $(( ${DISPLAY_WAIT_SECONDS:-30} * 10 ))); do
+        [ -S /tmp/.X11-unix/X${DISPLAY_NUM} ] && return 0
+        kill -0 $XVFB_PID 2>/dev/null || { echo "Xvfb exited, see ${LOG_OUTPUT_FOLDER}/xvfb.err" >&2; return 1; }
+        sleep 0.1
+    done
+    echo "X display $DISPLAY not ready after ${DISPLAY_WAIT_SECONDS:-30}s" >&2
+    return 1
+}
+
 # to overcome Pillow grab error unsupported bit depth
 Xvfb $DISPLAY -ac -screen 0 ${WIDTH}x${HEIGHT}x24 -dpi 96 2>${LOG_OUTPUT_FOLDER}/xvfb.err 1>${LOG_OUTPUT_FOLDER}/xvfb.log &
-tint2 -c $HOME/app/tint2/tint2rc 2>${LOG_OUTPUT_FOLDER}/tint2.err 1>${LOG_OUTPUT_FOLDER}/tint2.log &
-x11vnc -noxdamage -nopw -forever --viewonly --multiptr 2>${LOG_OUTPUT_FOLDER}/x11vnc.err 1>${LOG_OUTPUT_FOLDER}/x11vnc.log &
+XVFB_PID=$!
+
+# the panel and VNC server start once X is up; the agent imports its modules and
+# connects to AWS meanwhile, then waits for the display itself
+(
+    wait_for_x
+    tint2 -c $HOME/app/tint2/tint2rc 2>${LOG_OUTPUT_FOLDER}/tint2.err 1>${LOG_OUTPUT_FOLDER}/tint2.log &
+    x11vnc -noxdamage -nopw -forever --viewonly --multiptr 2>${LOG_OUTPUT_FOLDER}/x11vnc.err 1>${LOG_OUTPUT_FOLDER}/x11vnc.log &
+) &
 
 # exec "$@"
 python3 $HOME/app/main.py "$@"